@@ -0,0 +1,132 @@
+import datetime
+
+import numpy as np
+
+EPOCH = datetime.date(1970, 1, 1).toordinal()
+
+
+def period_label(ordinal):
+    return datetime.date.fromordinal(int(ordinal)).isoformat()
+
+
+class Analytics:
+    # Aggregations over the journal columns for the Overview and Analytics tabs. Each
+    # snapshot version is copied once into NumPy arrays, every aggregate is a
+    # vectorized group-by over them, and results are memoized per (version, query), so
+    # switching charts, ranges or users back and forth never rescans the store.
+
+    def __init__(self, journals, version):
+        self.journals = journals
+        self.version = version
+        self._frame = None
+        self._memo = {}
+
+    def frame(self):
+        version = self.version()
+        if self._frame is not None and self._frame['version'] == version:
+            return self._frame
+        j = self.journals
+        # tobytes() copies without exporting the arrays' buffers, which would make the
+        # sync thread's appends fail; lengths are trimmed in case it ran in between
+        mood = np.frombuffer(j.mood.tobytes(), dtype=np.float64)
+        day = np.frombuffer(j.day.tobytes(), dtype=np.int32)
+        user = np.frombuffer(j.user.tobytes(), dtype=np.int32)
+        people = list(j.people)
+        n = min(len(mood), len(day), len(user))
+        frame = {'version': version, 'mood': mood[:n], 'day': day[:n], 'user': user[:n], 'people': people}
+        if self.version() == version:
+            self._frame = frame
+            self._memo = {}
+        return frame
+
+    def _cached(self, name, args, compute):
+        frame = self.frame()
+        key = (frame['version'], name, args)
+        if key not in self._memo:
+            if len(self._memo) >= 256:
+                self._memo.clear()
+            self._memo[key] = compute(frame, *args)
+        return self._memo[key]
+
+    def _mask(self, frame, start=None, end=None, uid=None, dated=False):
+        mask = ~np.isnan(frame['mood'])
+        if dated or start is not None or end is not None:
+            mask &= frame['day'] > 0
+        if start is not None:
+            mask &= frame['day'] >= start
+        if end is not None:
+            mask &= frame['day'] <= end
+        if uid is not None:
+            mask &= frame['user'] == self.journals.codes.get(uid, -1)
+        return mask
+
+    def summary(self, start=None, end=None, uid=None):
+        def compute(frame, start, end, uid):
+            mood = frame['mood'][self._mask(frame, start, end, uid)]
+            return {'entries': int(mood.size), 'average': round(float(mood.mean()), 2) if mood.size else 0}
+        return self._cached('summary', (start, end, uid), compute)
+
+    def distribution(self, start=None, end=None, uid=None):
+        # entry counts for moods 1..5
+        def compute(frame, start, end, uid):
+            mood = frame['mood'][self._mask(frame, start, end, uid)]
+            whole = mood[(mood == np.round(mood)) & (mood >= 1) & (mood <= 5)].astype(np.int64)
+            return np.bincount(whole, minlength=6)[1:6].tolist()
+        return self._cached('distribution', (start, end, uid), compute)
+
+    def by_user(self, start=None, end=None, limit=15):
+        # most active users in the range: (username, entries, average mood)
+        def compute(frame, start, end, limit):
+            mask = self._mask(frame, start, end)
+            user, mood = frame['user'][mask], frame['mood'][mask]
+            size = len(frame['people'])
+            counts = np.bincount(user, minlength=size)
+            sums = np.bincount(user, weights=mood, minlength=size)
+            top = [int(i) for i in np.argsort(-counts, kind='stable')[:limit] if counts[i]]
+            return [(frame['people'][i][1] or frame['people'][i][0], int(counts[i]), round(float(sums[i] / counts[i]), 2)) for i in top]
+        return self._cached('by_user', (start, end, limit), compute)
+
+    def trend(self, start=None, end=None, uid=None, period='day'):
+        # per day/week: labels, entries, average mood, active users
+        def compute(frame, start, end, uid, period):
+            mask = self._mask(frame, start, end, uid, dated=True)
+            day, mood, user = frame['day'][mask], frame['mood'][mask], frame['user'][mask]
+            if period == 'week':
+                # ordinal 1 is a Monday, so this buckets Monday-to-Sunday weeks
+                day = day - (day - 1) % 7
+            keys, inverse = np.unique(day, return_inverse=True)
+            entries = np.bincount(inverse, minlength=keys.size)
+            sums = np.bincount(inverse, weights=mood, minlength=keys.size)
+            pairs = np.unique(inverse.astype(np.int64) * (len(frame['people']) + 1) + user)
+            active = np.bincount(pairs // (len(frame['people']) + 1), minlength=keys.size)
+            return {
+                'labels': [period_label(k) for k in keys],
+                'entries': entries.tolist(),
+                'average': np.round(sums / np.maximum(entries, 1), 2).tolist(),
+                'active': active.tolist(),
+            }
+        return self._cached('trend', (start, end, uid, period), compute)
+
+    def cohorts(self):
+        # users grouped by the month of their first entry: labels, users, entries per user, average mood
+        def compute(frame):
+            mask = self._mask(frame, dated=True)
+            day, mood, user = frame['day'][mask], frame['mood'][mask], frame['user'][mask]
+            size = len(frame['people'])
+            first = np.full(size, np.iinfo(np.int32).max, dtype=np.int64)
+            np.minimum.at(first, user, day)
+            months = (first - EPOCH).astype('datetime64[D]').astype('datetime64[M]')
+            seen = first < np.iinfo(np.int32).max
+            keys, inverse = np.unique(months[seen], return_inverse=True)
+            cohort = np.full(size, -1, dtype=np.int64)
+            cohort[seen] = inverse
+            users = np.bincount(inverse, minlength=keys.size)
+            entries = np.bincount(cohort[user], minlength=keys.size)
+            sums = np.bincount(cohort[user], weights=mood, minlength=keys.size)
+            return {
+                'labels': [str(k) for k in keys],
+                'users': users.tolist(),
+                'per_user': np.round(entries / np.maximum(users, 1), 2).tolist(),
+                'average': np.round(sums / np.maximum(entries, 1), 2).tolist(),
+            }
+        return self._cached('cohorts', (), compute)
@@ -0,0 +1,104 @@
+import os
+import secrets
+import sqlite3
+import time
+
+STORAGE_SECRET = os.getenv('STORAGE_SECRET', '')
+# the old built-in default and the README placeholder are public, so they sign nothing
+PUBLIC_SECRETS = ('mentaltrack_secret_key', 'a_long_random_string_for_cookies')
+LOGIN_TOKEN_TTL = 30
+SESSION_TTL = float(os.getenv('SESSION_TTL', 7 * 86400))
+
+
+def require_secret():
+    if not STORAGE_SECRET or STORAGE_SECRET in PUBLIC_SECRETS:
+        raise SystemExit('STORAGE_SECRET must be set to a private random value, e.g. `python -c "import secrets; print(secrets.token_urlsafe(32))"`')
+
+
+def check_credentials(email, password):
+    admin_email = os.getenv('ADMIN_EMAIL')
+    admin_password = os.getenv('ADMIN_PASSWORD')
+    return bool(admin_email and admin_password and email == admin_email and password == admin_password)
+
+
+class SessionStore:
+    # Logins kept on the server in SQLite. The browser cookie only carries an opaque,
+    # random session id, so signing a cookie is not enough to get in. Workers on one
+    # host share the file, so any of them can accept a session.
+    #
+    # The login form runs in a websocket event, which cannot set cookies, so it hands
+    # over to the /session page with a random one-time token: redeem() deletes it in
+    # the same transaction that reads it, and a replayed URL finds nothing.
+
+    def __init__(self, path):
+        self.path = path
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, email TEXT, expires REAL)')
+        conn.execute('CREATE TABLE IF NOT EXISTS tokens (token TEXT PRIMARY KEY, email TEXT, expires REAL)')
+        return conn
+
+    def issue_token(self, email, ttl=LOGIN_TOKEN_TTL):
+        token = secrets.token_urlsafe(32)
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute('DELETE FROM tokens WHERE expires < ?', (time.time(),))
+                conn.execute('INSERT INTO tokens VALUES (?, ?, ?)', (token, email, time.time() + ttl))
+        finally:
+            conn.close()
+        return token
+
+    def redeem_token(self, token):
+        # the email the token was issued for, once; None if it is unknown, used or expired
+        if not token:
+            return None
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute('BEGIN IMMEDIATE')
+                row = conn.execute('SELECT email, expires FROM tokens WHERE token = ?', (token,)).fetchone()
+                conn.execute('DELETE FROM tokens WHERE token = ?', (token,))
+        finally:
+            conn.close()
+        if row is None or row[1] < time.time():
+            return None
+        return row[0]
+
+    def create(self, email, ttl=SESSION_TTL):
+        session_id = secrets.token_urlsafe(32)
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute('DELETE FROM sessions WHERE expires < ?', (time.time(),))
+                conn.execute('INSERT INTO sessions VALUES (?, ?, ?)', (session_id, email, time.time() + ttl))
+        finally:
+            conn.close()
+        return session_id
+
+    def email(self, session_id):
+        # the logged-in email for a session id, None when there is no live session
+        if not session_id:
+            return None
+        try:
+            conn = self._connect()
+        except sqlite3.Error:
+            return None
+        try:
+            row = conn.execute('SELECT email FROM sessions WHERE id = ? AND expires >= ?', (session_id, time.time())).fetchone()
+        except sqlite3.Error:
+            return None
+        finally:
+            conn.close()
+        return row[0] if row else None
+
+    def drop(self, session_id):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute('DELETE FROM sessions WHERE id = ?', (session_id,))
+        finally:
+            conn.close()
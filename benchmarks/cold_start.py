@@ -0,0 +1,70 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_firebase import FakeFirebase
+from benchmarks.synthetic import make_users
+from columnar import JournalColumns
+from firebase import FirebaseSync
+from snapshot_cache import SnapshotCache
+from tables import PAGE_SIZE, TableQuery
+
+
+def first_snapshot(url, cache=None):
+    # (seconds until the store is populated, seconds until the Journals tab's first page,
+    # newest first, is built from it, rows); search indexes settle later, off this path
+    store = {'users': [], 'journals': JournalColumns()}
+    sync = FirebaseSync(store, base_url=url, cache=cache)
+    start = time.perf_counter()
+    if not sync.load_cache():
+        sync.sync()
+    populated = time.perf_counter() - start
+    with sync.lock:
+        rows, _, _ = TableQuery(lambda: store['journals'], lambda: sync.version).page(None, 'date', True, 1, PAGE_SIZE)
+    first_page = time.perf_counter() - start
+    assert len(rows) == min(PAGE_SIZE, len(store['journals']))
+    sync.stop()
+    return populated, first_page, len(store['journals'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cold-start time to a populated store and to the first journals page, with and without the on-disk cache')
+    parser.add_argument('--journals', type=int, default=100000)
+    parser.add_argument('--latency', type=float, default=0.2, help='simulated network latency per request (s)')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--out', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    data = make_users(args.journals)
+    results = {'journals': args.journals, 'latency': args.latency, 'network': [], 'network_page': [], 'cache': [], 'cache_page': []}
+    with FakeFirebase(data, latency=args.latency) as fake, tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'snapshot.sqlite3')
+        for _ in range(args.repeat):
+            populated, first_page, _ = first_snapshot(fake.url)
+            results['network'].append(populated)
+            results['network_page'].append(first_page)
+        # warm the cache once, as a previous instance would have
+        first_snapshot(fake.url, SnapshotCache(path))
+        for _ in range(args.repeat):
+            populated, first_page, rows = first_snapshot(fake.url, SnapshotCache(path))
+            assert rows == args.journals
+            results['cache'].append(populated)
+            results['cache_page'].append(first_page)
+        results['cache_bytes'] = os.path.getsize(path)
+
+    for key in ('network', 'cache'):
+        print(f'{key:>8}: store populated best {min(results[key]) * 1000:8.1f} ms, '
+              f'first page {min(results[key + "_page"]) * 1000:8.1f} ms  over {args.repeat} runs')
+    print(f'cache file: {results["cache_bytes"] / 1e6:.1f} MB for {args.journals} journals')
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeFirebase:
+    # Minimal stand-in for the RTDB REST API under /users: plain GET (with ETag) and
+    # the text/event-stream endpoint. push() sends a put/patch to every open stream,
+    # drop_streams() closes them as a network blip would.
+
+    def __init__(self, data, latency=0.0, host='127.0.0.1', port=0):
+        self.data = data
+        self.latency = latency
+        self.streams = []
+        # streams opened so far, to tell that a client reconnected
+        self.connections = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.url = f'http://{host}:{self.server.server_port}'
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self.lock:
+            for q in self.streams:
+                q.put(None)
+        self.server.shutdown()
+        self.server.server_close()
+
+    def drop_streams(self):
+        with self.lock:
+            for q in self.streams:
+                q.put(None)
+
+    def push(self, event, path, data):
+        with self.lock:
+            parts = [p for p in path.split('/') if p]
+            updates = {'/'.join(parts): data} if event == 'put' else {'/'.join(parts + [k]): v for k, v in data.items()}
+            for key, value in updates.items():
+                self._set([p for p in key.split('/') if p], value)
+            for q in self.streams:
+                q.put((event, path, data))
+
+    def _set(self, parts, value):
+        if not parts:
+            self.data = value or {}
+            return
+        node = self.data
+        for p in parts[:-1]:
+            node = node.setdefault(p, {})
+        if value is None:
+            node.pop(parts[-1], None)
+        else:
+            node[parts[-1]] = value
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split('?')[0] != '/users.json':
+                    self.send_error(404)
+                    return
+                if fake.latency:
+                    time.sleep(fake.latency)
+                if 'text/event-stream' in self.headers.get('Accept', ''):
+                    self._stream()
+                    return
+                body = json.dumps(fake.data).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('ETag', hashlib.sha1(body).hexdigest())
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _chunk(self, event, payload):
+                msg = f'event: {event}\ndata: {json.dumps(payload)}\n\n'.encode()
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(msg), msg))
+                self.wfile.flush()
+
+            def _stream(self):
+                q = queue.Queue()
+                with fake.lock:
+                    fake.streams.append(q)
+                    fake.connections += 1
+                try:
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/event-stream')
+                    self.send_header('Transfer-Encoding', 'chunked')
+                    self.end_headers()
+                    self._chunk('put', {'path': '/', 'data': fake.data})
+                    while True:
+                        try:
+                            item = q.get(timeout=30)
+                        except queue.Empty:
+                            self._chunk('keep-alive', None)
+                            continue
+                        if item is None:
+                            break
+                        event, path, data = item
+                        self._chunk(event, {'path': path, 'data': data})
+                except OSError:
+                    pass
+                finally:
+                    with fake.lock:
+                        fake.streams.remove(q)
+                    self.close_connection = True
+
+        return Handler
@@ -0,0 +1,122 @@
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_firebase import FakeFirebase
+from benchmarks.synthetic import make_users
+from columnar import JournalColumns
+from firebase import FirebaseSync, journal_rows, transform_journals, transform_users
+
+
+def retained(build):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size, elapsed
+
+
+def build_columns(data):
+    cols = JournalColumns()
+    for uid, content in data.items():
+        for row in journal_rows(uid, content):
+            cols.append(row)
+    return cols
+
+
+def build_sync(data):
+    # everything FirebaseSync keeps for a snapshot: store, positions, indexes and raw subtrees
+    with FakeFirebase(data) as fake:
+        sync = FirebaseSync({'users': [], 'journals': JournalColumns()}, base_url=fake.url)
+        sync.sync()
+        sync.settle()
+        sync.stop()
+        # ends the stream, so the sync thread exits and drops its references
+        fake.drop_streams()
+        sync._thread.join(10)
+    return sync
+
+
+def dict_aggregates(rows):
+    # what update_overview/update_chart did over the list of dicts
+    moods = [j['mood'] for j in rows if isinstance(j.get('mood'), (int, float))]
+    avg = sum(moods) / len(moods) if moods else 0
+    counts = [0, 0, 0, 0, 0]
+    for j in rows:
+        m = j.get('mood')
+        if isinstance(m, int) and 1 <= m <= 5:
+            counts[m - 1] += 1
+    return avg, counts
+
+
+def column_aggregates(cols):
+    moods = cols.mood_counts()
+    n = sum(moods.values())
+    avg = sum(m * c for m, c in moods.items()) / n if n else 0
+    return avg, [moods[float(m)] for m in range(1, 6)]
+
+
+def best(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Memory of the synced state vs the plain tables, and aggregation over dicts vs columns')
+    parser.add_argument('--journals', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--out', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    data = make_users(args.journals)
+    # the old store: the users and journals lists the dashboard rebuilt on every refresh
+    tables, table_bytes, table_build = retained(lambda: (transform_users(data), transform_journals(data)))
+    del tables
+    sync, sync_bytes, sync_build = retained(lambda: build_sync(data))
+    parts = sync.nbytes()
+    del sync
+
+    rows, dict_bytes, dict_build = retained(lambda: transform_journals(data))
+    cols, col_bytes, col_build = retained(lambda: build_columns(data))
+    assert dict_aggregates(rows) == column_aggregates(cols)
+
+    results = {
+        'journals': len(rows),
+        'tables': {'bytes': table_bytes, 'build': table_build},
+        'sync': {'bytes': sync_bytes, 'build': sync_build, 'parts': parts},
+        'dicts': {'bytes': dict_bytes, 'build': dict_build,
+                  'aggregate': best(lambda: dict_aggregates(rows), args.repeat),
+                  'page': best(lambda: [rows[i] for i in range(25)], args.repeat)},
+        'columns': {'bytes': col_bytes, 'build': col_build,
+                    'aggregate': best(lambda: column_aggregates(cols), args.repeat),
+                    'page': best(lambda: [cols.row(i) for i in range(25)], args.repeat)},
+    }
+    print(f'  tables: {table_bytes / 1e6:7.1f} MB retained  build {table_build * 1000:7.0f} ms')
+    print(f'    sync: {sync_bytes / 1e6:7.1f} MB retained  build {sync_build * 1000:7.0f} ms  ({sync_bytes / table_bytes:.1f}x the tables)')
+    for part, size in parts.items():
+        print(f'{part:>16}: {size / 1e6:7.1f} MB')
+    for name in ('dicts', 'columns'):
+        r = results[name]
+        print(f'{name:>8}: {r["bytes"] / 1e6:7.1f} MB retained  build {r["build"] * 1000:7.0f} ms  '
+              f'aggregate {r["aggregate"] * 1000:7.2f} ms  page of 25 {r["page"] * 1e6:6.1f} us')
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
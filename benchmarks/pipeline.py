@@ -0,0 +1,219 @@
+import argparse
+import datetime
+import gc
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import firebase
+from analytics import Analytics
+from benchmarks.fake_firebase import FakeFirebase
+from benchmarks.search import QUERIES
+from benchmarks.synthetic import make_users
+from columnar import JournalColumns
+from export import export_chunks, has_parquet
+from firebase import FirebaseSync, fetch_users, parse_date, transform_journals, transform_users
+from tables import TableQuery
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS = os.path.join(ROOT, 'benchmarks', 'results')
+SIZES = (1000, 100000, 1000000)
+# the Journals tab's columns and export fields, as in main.py
+COLUMNS = [{'label': label, 'field': field} for label, field in (
+    ('Date', 'date'), ('Username', 'username'), ('Email', 'email'), ('Mood', 'mood'), ('Summary', 'summary'), ('ImagePath', 'image'))]
+EXPORTS = [('csv', False), ('csv', True), ('jsonl', False), ('parquet', False)]
+# timings under this are too noisy to call a regression
+NOISE_FLOOR = 0.001
+
+
+def best(fn, repeat, setup=None):
+    # fastest of `repeat` runs; `setup` builds fresh state outside the timing
+    times = []
+    result = None
+    for _ in range(repeat):
+        arg = setup() if setup else None
+        gc.collect()
+        start = time.perf_counter()
+        result = fn(arg) if setup else fn()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def consume(chunks):
+    return sum(len(c) for c in chunks)
+
+
+def bench_source(fake, data, repeat):
+    # fetch, date parsing and transforms over the raw tree
+    results = {}
+    # fetch_users reads the module-level URL, which is how the app is pointed elsewhere too
+    firebase.FIREBASE_URL = fake.url
+    results['fetch_users'], fetched = best(fetch_users, repeat)
+    assert len(fetched) == len(data)
+    dates = [e.get('Date') for u in data.values() for e in u['journal'].values()]
+    results['parse_date'], _ = best(lambda: [parse_date(d) for d in dates], repeat)
+    results['parse_date_per_call'] = results['parse_date'] / max(len(dates), 1)
+    results['transform_users'], _ = best(lambda: transform_users(data), repeat)
+    results['transform_journals'], _ = best(lambda: len(transform_journals(data)), repeat)
+    return results
+
+
+def bench_first_load(fake, repeat):
+    # the store the dashboard serves from: stream snapshot, columns and all indexes
+    def fresh():
+        return FirebaseSync({'users': [], 'journals': JournalColumns()}, base_url=fake.url)
+
+    def load(sync):
+        sync.sync()
+        sync.stop()
+        # ends the stream, so the stopped sync thread exits and its copy is freed
+        fake.drop_streams()
+        return sync
+    seconds, sync = best(load, repeat, fresh)
+    return {'sync_first_load': seconds}, sync
+
+
+def load(journals, repeat, seed):
+    # the raw tree and the fake server are only alive in here, so they are freed before the query stages
+    start = time.perf_counter()
+    data = make_users(journals, seed=seed)
+    print(f'\n{journals} journals ({len(data)} users), generated in {time.perf_counter() - start:.1f} s')
+    with FakeFirebase(data) as fake:
+        results = bench_source(fake, data, repeat)
+        first, sync = bench_first_load(fake, repeat)
+    results.update(first)
+    return results, sync
+
+
+def run_size(journals, repeat, seed):
+    results, sync = load(journals, repeat, seed)
+    gc.collect()
+    store = sync.store
+    assert len(store['journals']) == journals
+
+    # first query folds the queued index entries in, as the first page view does
+    sync.journal_dates.select()
+    for q in QUERIES:
+        results[f'search:{q}'], _ = best(lambda: sync.search_journals(q), repeat)
+
+    today = datetime.date.today().toordinal()
+    hits = sync.search_journals('coffee')
+    for days in (7, 30, 365):
+        results[f'dates:last_{days}'], _ = best(lambda: sync.journal_dates.select(today - days, today), repeat)
+        results[f'dates:last_{days}+search'], _ = best(lambda: sync.journal_dates.select(today - days, today, hits), repeat)
+
+    version = lambda: sync.version
+    results['sort:date'], positions = best(lambda q: q.select(None, 'date', True), repeat,
+                                           lambda: TableQuery(lambda: store['journals'], version))
+
+    def analytics():
+        a = Analytics(store['journals'], version)
+        a.frame()
+        return a
+    results['charts:frame'], _ = best(lambda: Analytics(store['journals'], version).frame(), repeat)
+    for name, call in (
+        ('summary', lambda a: a.summary()),
+        ('distribution', lambda a: a.distribution()),
+        ('trend_day', lambda a: a.trend(period='day')),
+        ('trend_week', lambda a: a.trend(period='week')),
+        ('by_user', lambda a: a.by_user()),
+        ('cohorts', lambda a: a.cohorts()),
+    ):
+        results[f'charts:{name}'], _ = best(call, repeat, analytics)
+
+    # the /export/journals body, sorted by date, without the HTTP layer
+    journals_rows = store['journals']
+    for fmt, gzip in EXPORTS:
+        if fmt == 'parquet' and not has_parquet():
+            continue
+        name = f'export:{fmt}' + ('.gz' if gzip else '')
+        results[name], size = best(lambda: consume(export_chunks(
+            (journals_rows[i] for i in positions), fmt, COLUMNS, JournalColumns.FIELDS, {'mood': 'float64'}, gzip)), repeat)
+        results[f'{name}_bytes'] = size
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, timeout=10).stdout.strip()
+    except Exception:
+        return ''
+
+
+def previous_run(exclude=None):
+    runs = sorted(p for p in glob.glob(os.path.join(RESULTS, 'pipeline-*.json')) if p != exclude)
+    return runs[-1] if runs else None
+
+
+def compare(current, baseline, threshold):
+    # stage timings that got slower than `threshold` x the baseline; sizes and counts are not timings
+    regressions = []
+    for size, stages in current['sizes'].items():
+        before = baseline.get('sizes', {}).get(size, {})
+        for stage, seconds in stages.items():
+            old = before.get(stage)
+            if old is None or stage.endswith('_bytes') or stage.endswith('_per_call'):
+                continue
+            if max(seconds, old) >= NOISE_FLOOR and seconds > old * threshold:
+                regressions.append((size, stage, old, seconds))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fetch, transform, parse, search, date filter, chart and export timings on synthetic data')
+    parser.add_argument('--sizes', default=','.join(map(str, SIZES)), help='comma-separated journal counts')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--out', help=f'results file (default: a new pipeline-<time>.json in {os.path.relpath(RESULTS, ROOT)})')
+    parser.add_argument('--baseline', help='results file to compare against (default: the previous run)')
+    parser.add_argument('--threshold', type=float, default=1.25, help='slowdown ratio reported as a regression')
+    args = parser.parse_args()
+
+    results = {
+        'started': datetime.datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'machine': f'{platform.system()} {platform.machine()} x{os.cpu_count()}',
+        'repeat': args.repeat,
+        'seed': args.seed,
+        'sizes': {},
+    }
+    for size in (int(s) for s in args.sizes.split(',') if s.strip()):
+        stages = run_size(size, args.repeat, args.seed)
+        results['sizes'][str(size)] = stages
+        for stage, value in stages.items():
+            if stage.endswith('_bytes'):
+                print(f'{stage:>28}: {value / 1e6:10.2f} MB')
+            elif stage.endswith('_per_call'):
+                print(f'{stage:>28}: {value * 1e6:10.2f} us')
+            else:
+                print(f'{stage:>28}: {value * 1000:10.2f} ms')
+
+    out = args.out or os.path.join(RESULTS, f'pipeline-{datetime.datetime.now():%Y%m%d-%H%M%S}.json')
+    baseline_path = args.baseline or previous_run(exclude=os.path.abspath(out))
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'\nresults written to {out}')
+
+    if not baseline_path:
+        return
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.threshold)
+    print(f'compared with {baseline_path} (commit {baseline.get("commit") or "?"})')
+    for size, stage, old, new in regressions:
+        print(f'  REGRESSION {size:>8} {stage:>28}: {old * 1000:.2f} ms -> {new * 1000:.2f} ms ({new / old:.2f}x)')
+    if regressions:
+        sys.exit(1)
+    print(f'  no stage slower than {args.threshold}x')
+
+
+if __name__ == '__main__':
+    main()
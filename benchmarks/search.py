@@ -0,0 +1,69 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_firebase import FakeFirebase
+from benchmarks.synthetic import make_users
+from columnar import JournalColumns
+from firebase import FirebaseSync, transform_journals
+
+QUERIES = ('coffee', 'cof', 'ee', 'user42', 'user42@example', 'coffee stress', 'felt calm today', 'nomatch')
+FIELDS = ('summary', 'username', 'email', 'uid')
+
+
+def scan(rows, query):
+    # the linear filter the Journals tab used before the index, with AND across terms
+    terms = query.lower().split()
+    return {(r['uid'], r['push_id']) for r in rows
+            if all(any(t in (r.get(f) or '').lower() for f in FIELDS) for t in terms)}
+
+
+def best(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Journal search: inverted index vs linear scan')
+    parser.add_argument('--journals', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--out', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    data = make_users(args.journals)
+    rows = transform_journals(data)
+    # the indexes the dashboard searches: summaries per entry, names, emails and uids per user
+    sync = FirebaseSync({'users': [], 'journals': JournalColumns()})
+    with FakeFirebase(data) as fake:
+        sync.base_url = fake.url
+        sync.sync()
+        sync.stop()
+        fake.drop_streams()
+    start = time.perf_counter()
+    sync.settle()
+    build = time.perf_counter() - start
+    tokens = len(sync.journal_text.postings) + len(sync.user_text.postings)
+    print(f'index build: {build * 1000:.0f} ms for {len(rows)} journals ({tokens} tokens)')
+
+    results = {'journals': len(rows), 'build': build, 'queries': {}}
+    for q in QUERIES:
+        t_scan, expected = best(lambda: scan(rows, q), max(1, args.repeat // 2))
+        t_index, got = best(lambda: sync.search_journals(q), args.repeat)
+        assert got == expected, q
+        results['queries'][q] = {'scan': t_scan, 'index': t_index, 'hits': len(got)}
+        print(f'{q!r:>20}: scan {t_scan * 1000:8.2f} ms  index {t_index * 1000:8.3f} ms  ({len(got)} hits)')
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
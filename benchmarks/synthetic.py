@@ -0,0 +1,66 @@
+import random
+import string
+import time
+
+PUSH_CHARS = '-0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_abcdefghijklmnopqrstuvwxyz'
+WORDS = ('felt', 'calm', 'tired', 'anxious', 'happy', 'work', 'sleep', 'family', 'walk', 'exam',
+         'rain', 'friends', 'coffee', 'stress', 'better', 'gym', 'meeting', 'deadline', 'music', 'today')
+
+
+def push_id(ms, rng):
+    # same layout as Firebase push keys: 8 chars of timestamp, 12 random chars
+    head = []
+    for _ in range(8):
+        head.append(PUSH_CHARS[ms % 64])
+        ms //= 64
+    return ''.join(reversed(head)) + ''.join(rng.choice(PUSH_CHARS) for _ in range(12))
+
+
+def messy_date(ts, rng):
+    # the shapes parse_date has to cope with, weighted towards the common ones
+    t = time.gmtime(ts)
+    day = time.strftime('%Y-%m-%d', t)
+    clock = time.strftime('%H:%M:%S', t)
+    shape = rng.random()
+    if shape < 0.4:
+        return f'{day}T{clock}.{rng.randrange(1000):03d}Z'
+    if shape < 0.6:
+        return f'{day}T{clock}'
+    if shape < 0.75:
+        return day
+    if shape < 0.85:
+        return f'{day}T{clock}.{rng.randrange(1000000):06d}'
+    if shape < 0.92:
+        return f'`{day}`'
+    if shape < 0.97:
+        return f'{day} {clock[:5]}'
+    return rng.choice(('', 'yesterday', None))
+
+
+def make_users(journals=1000, per_user=20, seed=1, days=365):
+    rng = random.Random(seed)
+    now = int(time.time())
+    users = {}
+    n_users = max(1, journals // per_user)
+    for i in range(n_users):
+        uid = ''.join(rng.choice(string.ascii_letters + string.digits) for _ in range(28))
+        name = f'user{i}'
+        users[uid] = {
+            'profile': {
+                'Username': name,
+                'Email': f'{name}@example.com',
+                'PhotoUrl': f'https://example.com/avatars/{i}.jpg' if rng.random() < 0.5 else '',
+            },
+            'journal': {},
+        }
+    uids = list(users)
+    for _ in range(journals):
+        uid = rng.choice(uids)
+        ts = now - rng.randrange(days * 86400)
+        users[uid]['journal'][push_id(ts * 1000, rng)] = {
+            'Mood': rng.randint(1, 5),
+            'Summary': ' '.join(rng.choice(WORDS) for _ in range(rng.randint(3, 25))),
+            'Date': messy_date(ts, rng),
+            'ImagePath': f'https://example.com/images/{rng.randrange(10 ** 9)}.jpg' if rng.random() < 0.3 else '',
+        }
+    return users
@@ -0,0 +1,195 @@
+import array
+import sys
+from collections import Counter
+
+from indexes import day_ordinal
+
+NAN = float('nan')
+
+
+def mood_number(mood):
+    # numeric moods, including numeric strings such as "5"; None otherwise
+    if isinstance(mood, bool) or mood is None:
+        return None
+    if isinstance(mood, (int, float)):
+        return float(mood)
+    try:
+        return float(str(mood).strip())
+    except ValueError:
+        return None
+
+
+class JournalColumns:
+    # Column-per-field store for journal entries. Users are dictionary-encoded (one
+    # [uid, username, email] record per user, referenced by code), moods and day
+    # ordinals live in typed arrays, and repeated strings such as dates are interned.
+    # Row dicts are only built on access, e.g. for the page a table is showing.
+    # Slots are dense: removing one moves the last entry into its place.
+
+    FIELDS = ('uid', 'push_id', 'username', 'email', 'mood', 'summary', 'date', 'image')
+
+    def __init__(self):
+        self.people = []
+        self.codes = {}
+        self.user = array.array('i')
+        self.push_id = []
+        self.mood = array.array('d')
+        # moods that are not numbers, kept as given, by slot
+        self.raw_mood = {}
+        self.day = array.array('i')
+        self.date = []
+        self.summary = []
+        self.image = []
+
+    def __len__(self):
+        return len(self.push_id)
+
+    def __getitem__(self, slot):
+        return self.row(slot)
+
+    def __iter__(self):
+        for slot in range(len(self)):
+            yield self.row(slot)
+
+    def clear(self):
+        self.__init__()
+
+    def replace(self, other):
+        # takes over another instance's columns, keeping this object for whoever holds it
+        self.__dict__.update(vars(other))
+
+    def code(self, uid, username='', email=''):
+        code = self.codes.get(uid)
+        if code is None:
+            code = self.codes[uid] = len(self.people)
+            self.people.append([uid, username, email])
+        return code
+
+    def set_person(self, uid, username, email):
+        person = self.people[self.code(uid)]
+        person[1] = username
+        person[2] = email
+
+    def key(self, slot):
+        return self.people[self.user[slot]][0], self.push_id[slot]
+
+    def row(self, slot):
+        uid, username, email = self.people[self.user[slot]]
+        m = self.mood[slot]
+        if m != m:
+            mood = self.raw_mood.get(slot)
+        else:
+            mood = int(m) if m.is_integer() else m
+        return {
+            'uid': uid,
+            'push_id': self.push_id[slot],
+            'username': username,
+            'email': email,
+            'mood': mood,
+            'summary': self.summary[slot],
+            'date': self.date[slot],
+            'image': self.image[slot],
+        }
+
+    def append(self, row):
+        self.user.append(self.code(row['uid'], row['username'], row['email']))
+        self.push_id.append(row['push_id'])
+        self.mood.append(NAN)
+        self.day.append(0)
+        self.date.append('')
+        self.summary.append('')
+        self.image.append('')
+        slot = len(self.push_id) - 1
+        self.update(slot, row)
+        return slot
+
+    def extend(self, rows):
+        # bulk append for a whole snapshot, a column at a time; `rows` is a list. Dates
+        # repeat across entries, so each distinct one is parsed and interned once.
+        start = len(self.push_id)
+        code = self.code
+        raw_mood = self.raw_mood
+        dates = {}
+        users, moods, days, interned = [], [], [], []
+        for slot, r in enumerate(rows, start):
+            users.append(code(r['uid'], r['username'], r['email']))
+            mood = r.get('mood')
+            number = mood_number(mood)
+            if number is None:
+                moods.append(NAN)
+                if mood is not None and mood != '':
+                    raw_mood[slot] = mood
+            else:
+                moods.append(number)
+            date = r.get('date') or ''
+            known = dates.get(date)
+            if known is None:
+                known = dates[date] = (sys.intern(date), day_ordinal(date) or 0)
+            interned.append(known[0])
+            days.append(known[1])
+        self.user.extend(users)
+        self.mood.extend(moods)
+        self.day.extend(days)
+        self.date.extend(interned)
+        self.push_id.extend([r['push_id'] for r in rows])
+        self.summary.extend([r.get('summary') or '' for r in rows])
+        self.image.extend([sys.intern(r.get('image') or '') for r in rows])
+
+    def update(self, slot, row):
+        mood = row.get('mood')
+        date = row.get('date') or ''
+        number = mood_number(mood)
+        self.mood[slot] = NAN if number is None else number
+        if number is None and mood is not None and mood != '':
+            self.raw_mood[slot] = mood
+        else:
+            self.raw_mood.pop(slot, None)
+        self.day[slot] = day_ordinal(date) or 0
+        self.date[slot] = sys.intern(date)
+        self.summary[slot] = row.get('summary') or ''
+        self.image[slot] = sys.intern(row.get('image') or '')
+
+    def remove(self, slot):
+        # returns the key of the entry moved into `slot`, if any
+        last = len(self.push_id) - 1
+        moved = None
+        raw_mood = self.raw_mood.pop(last, None)
+        self.raw_mood.pop(slot, None)
+        if slot != last:
+            if raw_mood is not None:
+                self.raw_mood[slot] = raw_mood
+            for col in (self.user, self.push_id, self.mood, self.day, self.date, self.summary, self.image):
+                col[slot] = col[last]
+            moved = self.key(slot)
+        for col in (self.user, self.push_id, self.mood, self.day, self.date, self.summary, self.image):
+            col.pop()
+        return moved
+
+    def column(self, field):
+        # plain per-slot values of one field, for sorting
+        if field not in self.FIELDS:
+            raise ValueError(f'unknown journal field: {field}')
+        if field in ('uid', 'username', 'email'):
+            i = ('uid', 'username', 'email').index(field)
+            values = [p[i] for p in self.people]
+            return [values[c] for c in self.user]
+        if field == 'mood':
+            return [self.raw_mood.get(slot) if m != m else m for slot, m in enumerate(self.mood)]
+        return getattr(self, field)
+
+    def mood_counts(self):
+        # {mood: count} over entries with a numeric mood
+        counts = Counter(self.mood)
+        for m in [m for m in counts if m != m]:
+            del counts[m]
+        return counts
+
+    def nbytes(self):
+        # rough footprint: typed arrays, list slots, per-row strings, and interned strings once
+        size = sum(len(a) * a.itemsize for a in (self.user, self.mood, self.day))
+        size += sum(sys.getsizeof(col) for col in (self.people, self.push_id, self.date, self.summary, self.image))
+        size += sum(map(sys.getsizeof, self.push_id)) + sum(map(sys.getsizeof, self.summary))
+        size += sum(map(sys.getsizeof, set(self.date))) + sum(map(sys.getsizeof, set(self.image)))
+        size += sum(sys.getsizeof(p) + sum(map(sys.getsizeof, p)) for p in self.people)
+        size += sys.getsizeof(self.raw_mood) + sum(map(sys.getsizeof, self.raw_mood.values()))
+        return size
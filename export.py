@@ -0,0 +1,130 @@
+import csv
+import io
+import json
+import zlib
+
+BATCH = 1000
+
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'jsonl': ('application/x-ndjson', 'jsonl'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+
+def has_parquet():
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def export_options():
+    # (format, gzip, menu label) for the export menus
+    options = [('csv', False, 'CSV'), ('csv', True, 'CSV (gzip)'), ('jsonl', False, 'JSONL'), ('jsonl', True, 'JSONL (gzip)')]
+    if has_parquet():
+        options.append(('parquet', False, 'Parquet'))
+    return options
+
+
+def batched(rows, size):
+    batch = []
+    for r in rows:
+        batch.append(r)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def csv_chunks(rows, columns):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow([c['label'] for c in columns])
+    for batch in batched(rows, BATCH):
+        writer.writerows([r.get(c['field']) for c in columns] for r in batch)
+        yield buf.getvalue().encode('utf-8')
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode('utf-8')
+
+
+def jsonl_chunks(rows, fields):
+    for batch in batched(rows, BATCH):
+        yield ''.join(json.dumps({f: r.get(f) for f in fields}, ensure_ascii=False) + '\n' for r in batch).encode('utf-8')
+
+
+class _Sink:
+    # write-only file object that hands back whatever was written since the last take()
+
+    def __init__(self):
+        self.parts = []
+        self.pos = 0
+        self.closed = False
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.pos += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.pos
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+def typed(value, numeric):
+    # Parquet columns are typed; a number column leaves values that are not numbers empty
+    if numeric:
+        return value if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+    return None if value is None else str(value)
+
+
+def parquet_chunks(rows, fields, types=None):
+    # one row group per batch, each yielded as soon as it is encoded
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    types = types or {}
+    schema = pa.schema([(f, getattr(pa, types.get(f, 'string'))()) for f in fields])
+    numeric = {f for f in fields if types.get(f, 'string') != 'string'}
+    sink = _Sink()
+    writer = pq.ParquetWriter(sink, schema)
+    for batch in batched(rows, BATCH * 10):
+        writer.write_table(pa.Table.from_pylist([{f: typed(r.get(f), f in numeric) for f in fields} for r in batch], schema=schema))
+        yield sink.take()
+    writer.close()
+    yield sink.take()
+
+
+def gzipped(chunks):
+    z = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        out = z.compress(chunk)
+        if out:
+            yield out
+    yield z.flush()
+
+
+def export_chunks(rows, fmt, columns, fields, types=None, gzip=False):
+    if fmt == 'csv':
+        chunks = csv_chunks(rows, columns)
+    elif fmt == 'jsonl':
+        chunks = jsonl_chunks(rows, fields)
+    elif fmt == 'parquet':
+        chunks = parquet_chunks(rows, fields, types)
+    else:
+        raise ValueError(f'unknown export format: {fmt}')
+    return gzipped(chunks) if gzip else chunks
@@ -0,0 +1,633 @@
+import datetime
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+import zlib
+from collections import deque
+
+import requests
+
+import metrics
+from columnar import JournalColumns
+from indexes import DateIndex, GroupIndex, TextIndex, day_ordinal
+
+FIREBASE_URL = os.getenv('FIREBASE_URL', 'https://mad-mental-default-rtdb.asia-southeast1.firebasedatabase.app')
+CHANGE_LOG = 64
+
+FETCH_SECONDS = metrics.histogram('firebase_fetch_seconds', 'Full /users.json reads, by outcome')
+FETCH_BYTES = metrics.histogram('firebase_fetch_bytes', 'Payload size of full /users.json reads', metrics.SIZE_BUCKETS)
+SYNC_ERRORS = metrics.counter('sync_errors_total', 'Failed Firebase reads, stream disconnects and cache writes, by source and reason')
+STREAM_BYTES = metrics.counter('firebase_stream_bytes_total', 'Bytes of streamed event data')
+STREAM_EVENTS = metrics.counter('firebase_stream_events_total', 'Streamed events, by type')
+TRANSFORM_SECONDS = metrics.histogram('transform_seconds', 'Building store rows from Firebase data, by step')
+SYNC_USERS = metrics.histogram('sync_users_applied', 'Users rebuilt per flush into the store', metrics.COUNT_BUCKETS)
+
+
+def fetch_snapshot(base_url=None):
+    # (data, etag); data is None when the read failed
+    start = time.perf_counter()
+    try:
+        r = requests.get(f'{base_url or FIREBASE_URL}/users.json', headers={'X-Firebase-ETag': 'true'}, timeout=15)
+        FETCH_BYTES.observe(len(r.content))
+        if r.status_code == 200:
+            data = r.json() or {}
+            FETCH_SECONDS.observe(time.perf_counter() - start, outcome='ok')
+            return data, r.headers.get('ETag')
+        SYNC_ERRORS.inc(source='fetch', reason=f'http_{r.status_code}')
+    except Exception as e:
+        SYNC_ERRORS.inc(source='fetch', reason=type(e).__name__)
+    FETCH_SECONDS.observe(time.perf_counter() - start, outcome='error')
+    return None, None
+
+
+def fetch_users():
+    data, _ = fetch_snapshot()
+    return data or {}
+
+
+def parse_date(s):
+    try:
+        if not s:
+            return None
+        ss = str(s).strip().strip('`')
+        if not ss:
+            return None
+        ss = ss.replace('Z', '+00:00')
+        try:
+            return datetime.datetime.fromisoformat(ss).date()
+        except Exception:
+            pass
+        for fmt in ('%Y-%m-%d', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%dT%H:%M:%S.%f'):
+            try:
+                return datetime.datetime.strptime(ss, fmt).date()
+            except Exception:
+                continue
+        if len(ss) >= 10:
+            try:
+                return datetime.datetime.strptime(ss[:10], '%Y-%m-%d').date()
+            except Exception:
+                return None
+        return None
+    except Exception:
+        return None
+
+
+def user_row(uid, content):
+    profile = (content or {}).get('profile') or {}
+    journal = (content or {}).get('journal') or {}
+    return {
+        'uid': uid,
+        'username': profile.get('Username') or '',
+        'email': profile.get('Email') or '',
+        'photo': profile.get('PhotoUrl') or '',
+        'journals': len(journal),
+    }
+
+
+def journal_row(uid, push_id, entry, username, email):
+    entry = entry if isinstance(entry, dict) else {}
+    date_raw = entry.get('Date') or ''
+    dt = parse_date(date_raw)
+    date = dt.isoformat() if dt else (date_raw[:10] if isinstance(date_raw, str) and len(date_raw) >= 10 else '')
+    return {
+        'uid': uid,
+        'push_id': push_id,
+        'username': username,
+        'email': email,
+        'mood': entry.get('Mood'),
+        'summary': entry.get('Summary') or '',
+        'date': date,
+        'image': entry.get('ImagePath') or '',
+    }
+
+
+def journal_rows(uid, content):
+    profile = (content or {}).get('profile') or {}
+    username = profile.get('Username') or ''
+    email = profile.get('Email') or ''
+    journal = (content or {}).get('journal') or {}
+    return [journal_row(uid, push_id, entry, username, email) for push_id, entry in journal.items()]
+
+
+def encode(content):
+    # canonical JSON, the form content hashes are taken of
+    return json.dumps(content, sort_keys=True, separators=(',', ':')).encode()
+
+
+def content_hash(content):
+    return hashlib.sha1(encode(content)).hexdigest()
+
+
+def user_rows(uid, content):
+    # (user row, {push_id: journal row}) for one user's subtree, None when it holds no user
+    if not isinstance(content, dict):
+        return None
+    row = user_row(uid, content)
+    journal = content.get('journal') or {}
+    return row, {push_id: journal_row(uid, push_id, entry, row['username'], row['email']) for push_id, entry in journal.items()}
+
+
+def transform_users(data):
+    with TRANSFORM_SECONDS.time(step='users'):
+        return [user_row(uid, content) for uid, content in (data or {}).items()]
+
+
+def transform_journals(data):
+    with TRANSFORM_SECONDS.time(step='journals'):
+        rows = []
+        for uid, content in (data or {}).items():
+            rows.extend(journal_rows(uid, content))
+        return rows
+
+
+class FirebaseSync:
+    # Keeps `store` in step with /users using the RTDB streaming endpoint: the first
+    # `put /` event is the initial snapshot, every later event is a delta that only
+    # marks the touched users/entries dirty. sync() folds the dirty set into the
+    # store lists in place, so a refresh costs what changed since the last one.
+    #
+    # Each user's raw subtree is kept as compressed canonical JSON next to its hash;
+    # an event decodes only the user it touches. Flushes, follower reads and cache
+    # loads build rows (for a whole snapshot, fresh columns and indexes too) before
+    # taking `lock`, so readers only wait for the short apply or swap at the end.
+
+    # journal rows are indexed by summary only; their author's fields are found through
+    # user_text and user_journals (see search_journals), not repeated per entry
+    USER_TEXT = ('username', 'email', 'uid')
+    JOURNAL_TEXT = ('summary',)
+
+    def __init__(self, store, base_url=None, retry=5, cache=None):
+        self.store = store
+        self.base_url = base_url or FIREBASE_URL
+        self.retry = retry
+        self.cache = cache
+        self.etag = None
+        # position in the shared snapshot this process has read up to (follower mode)
+        self.cursor = None
+        # uid -> compressed subtree and its content_hash, as of the last flush
+        self.raw = {}
+        self.hashes = {}
+        # uid -> subtree changed by events since the last flush, None when deleted
+        self.open = {}
+        self.dirty = {}
+        self.user_pos = {}
+        self.journal_pos = {}
+        self.journal_ids = {}
+        self.user_journals = GroupIndex()
+        self.user_text = TextIndex(self.USER_TEXT, whole_fields=self.USER_TEXT)
+        self.journal_text = TextIndex(self.JOURNAL_TEXT)
+        self.journal_dates = DateIndex()
+        self.version = 0
+        # (version, touched uids, touched journal keys) per flush, for diffing sessions
+        self.changes = deque(maxlen=CHANGE_LOG)
+        self._touched = (set(), set())
+        # held while the store changes; readers take it too, so positions, rows and indexes agree
+        self.lock = threading.Lock()
+        # guards raw, hashes, open, dirty and etag between the stream thread and flushes
+        self.events = threading.Lock()
+        # one flush, follower read or cache load at a time, since they build outside `lock`
+        self.writer = threading.Lock()
+        self.loaded = threading.Event()
+        self.connected = False
+        self._stop = threading.Event()
+        self._thread = None
+        self._session = requests.Session()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='firebase-sync', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def load_cache(self):
+        # seeds store, position maps and per-user hashes from the on-disk snapshot; returns its timestamp
+        with TRANSFORM_SECONDS.time(step='cache_load'), self.writer:
+            snap = self.cache.load() if self.cache else None
+            if snap is None:
+                return None
+            self._load_snapshot(snap)
+        return snap['saved_at']
+
+    def follow(self):
+        # follower mode: another worker owns the Firebase connection and writes the shared
+        # snapshot; fold in the users it saved since our cursor. Returns the data's age stamp.
+        self.stop()
+        self.loaded.clear()
+        with self.writer:
+            # a former leader's raw tree need not match the file, so it reloads the file whole
+            with TRANSFORM_SECONDS.time(step='follow_read'):
+                snap = self.cache.load_since(None if self.raw else self.cursor) if self.cache else None
+            if snap is None:
+                SYNC_ERRORS.inc(source='follow', reason='no_snapshot')
+                return None
+            if snap['full']:
+                self._load_snapshot(snap)
+                return snap['checked_at']
+            journals = {}
+            for r in snap['journals']:
+                journals.setdefault(r['uid'], {})[r['push_id']] = r
+            with self.events:
+                for uid in snap['removed']:
+                    self.hashes.pop(uid, None)
+                self.hashes.update(snap['hashes'])
+                self.etag = snap['etag']
+            with self.lock:
+                for uid in snap['removed']:
+                    self._touched[0].add(uid)
+                    self._remove_user(uid)
+                for r in snap['users']:
+                    uid = r['uid']
+                    self._touched[0].add(uid)
+                    rows = journals.get(uid, {})
+                    self._apply_rows(uid, r, {**{push_id: None for push_id in self.user_journals.keys(uid) if push_id not in rows}, **rows})
+                self.cursor = snap['cursor']
+                if snap['users'] or snap['removed']:
+                    self.version += 1
+                    self.changes.append((self.version,) + self._touched)
+                    self._touched = (set(), set())
+        return snap['checked_at']
+
+    def _load_snapshot(self, snap):
+        # under `writer`; the new state is built first and swapped in under `lock`
+        built = self._build(snap['users'], snap['journals'])
+        with self.events:
+            self.raw = {}
+            self.open = {}
+            self.dirty = {}
+            self.hashes = snap['hashes']
+            self.etag = snap['etag']
+        self.cursor = snap['cursor']
+        with self.lock:
+            self._install(*built)
+
+    def _build(self, users, journals):
+        # fresh columns, position maps and indexes for whole tables; nothing shared is touched.
+        # The text indexes are queued (see settle()), since tokenizing is most of the cost.
+        columns = JournalColumns()
+        columns.extend(journals)
+        keys = [(r['uid'], r['push_id']) for r in journals]
+        journal_pos = {key: pos for pos, key in enumerate(keys)}
+        journal_ids = {key[1]: key for key in keys}
+        user_journals = GroupIndex()
+        user_journals.load((r['uid'], r['push_id'], r['date']) for r in journals)
+        user_pos = {r['uid']: i for i, r in enumerate(users)}
+        user_text = TextIndex(self.USER_TEXT, whole_fields=self.USER_TEXT)
+        user_text.load([(r['uid'], r) for r in users])
+        journal_text = TextIndex(self.JOURNAL_TEXT)
+        journal_text.load(list(zip(keys, journals)))
+        journal_dates = DateIndex()
+        journal_dates.load((key, day or None) for key, day in zip(keys, columns.day))
+        return users, columns, (user_pos, journal_pos, journal_ids, user_journals, user_text, journal_text, journal_dates)
+
+    def _install(self, users, columns, state):
+        # under `lock`; the store objects themselves stay, since pages and analytics hold them
+        (self.user_pos, self.journal_pos, self.journal_ids, self.user_journals,
+         self.user_text, self.journal_text, self.journal_dates) = state
+        self.store['users'][:] = users
+        self.store['journals'].replace(columns)
+        self.version += 1
+        # everything was replaced, so no diff reaches back past this version
+        self.changes.clear()
+        self._touched = (set(), set())
+
+    def settle(self):
+        # indexes the rows a whole-snapshot load queued, ahead of the first search
+        self.user_text.settle()
+        self.journal_text.settle()
+        self.journal_dates.settle()
+
+    def search_journals(self, query):
+        # (uid, push_id) keys of the entries whose summary or author matches every term; None for an empty query
+        terms = (query or '').lower().split()
+        if not terms:
+            return None
+        result = None
+        for term in sorted(set(terms), key=len, reverse=True):
+            keys = self.journal_text.match(term)
+            for uid in self.user_text.match(term):
+                keys.update((uid, push_id) for push_id in self.user_journals.keys(uid))
+            result = keys if result is None else result & keys
+            if not result:
+                return set()
+        return result
+
+    def journal(self, push_id):
+        # row of one journal entry by push id, None if it is gone
+        with self.lock:
+            pos = self.journal_pos.get(self.journal_ids.get(push_id))
+            journals = self.store['journals']
+            return journals.row(pos) if pos is not None and pos < len(journals) else None
+
+    def recent_journals(self, uid, offset=0, limit=None):
+        # one user's entries, newest first, without touching anyone else's
+        with self.lock:
+            journals = self.store['journals']
+            rows = []
+            for push_id in self.user_journals.page(uid, offset, limit):
+                pos = self.journal_pos.get((uid, push_id))
+                if pos is not None and pos < len(journals):
+                    rows.append(journals.row(pos))
+            return rows
+
+    def changes_since(self, version):
+        # (uids, journal keys) touched after `version`; None when the log does not reach back that far
+        log = list(self.changes)
+        if version == self.version:
+            return set(), set()
+        if version is None or not log or log[0][0] > version + 1:
+            return None
+        users, journals = set(), set()
+        for v, u, j in log:
+            if v > version:
+                users |= u
+                journals |= j
+        return users, journals
+
+    def nbytes(self):
+        # rough footprint of everything held for the snapshot, by part
+        with self.lock:
+            users = self.store['users']
+            positions = sum(map(sys.getsizeof, (self.user_pos, self.journal_pos, self.journal_ids)))
+            # the (uid, push_id) keys, shared by the position maps and the indexes
+            positions += sum(map(sys.getsizeof, self.journal_pos))
+            sizes = {
+                'journals': self.store['journals'].nbytes(),
+                'users': sys.getsizeof(users) + sum(sys.getsizeof(r) + sum(map(sys.getsizeof, r.values())) for r in users),
+                'positions': positions,
+            }
+        sizes['user_journals'] = self.user_journals.nbytes()
+        sizes['journal_dates'] = self.journal_dates.nbytes()
+        sizes['user_text'] = self.user_text.nbytes()
+        sizes['journal_text'] = self.journal_text.nbytes()
+        with self.events:
+            sizes['raw'] = sys.getsizeof(self.raw) + sys.getsizeof(self.hashes) + sum(map(sys.getsizeof, self.raw.values()))
+            sizes['raw'] += sum(map(sys.getsizeof, self.hashes.values()))
+        return sizes
+
+    def sync(self, timeout=15):
+        self.start()
+        self.loaded.wait(timeout)
+        if not (self.connected and self.loaded.is_set()):
+            # no live stream to trust; fall back to a plain read, diffed per user
+            data, etag = fetch_snapshot(self.base_url)
+            if not data:
+                return False
+            with self.events:
+                if not (etag and etag == self.etag and self.raw):
+                    self.etag = etag
+                    self._replace(data)
+                self.loaded.set()
+        self._flush()
+        return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                with self._session.get(f'{self.base_url}/users.json', headers={'Accept': 'text/event-stream'}, stream=True, timeout=(10, 90)) as r:
+                    if r.status_code != 200:
+                        raise RuntimeError(f'stream returned {r.status_code}')
+                    self.connected = True
+                    event = None
+                    for line in self._lines(r):
+                        if self._stop.is_set():
+                            return
+                        if line.startswith('event:'):
+                            event = line[6:].strip()
+                        elif line.startswith('data:'):
+                            if event in ('cancel', 'auth_revoked'):
+                                break
+                            STREAM_BYTES.inc(len(line))
+                            STREAM_EVENTS.inc(type=event or 'none')
+                            self._handle(event, line[5:].strip())
+            except Exception as e:
+                SYNC_ERRORS.inc(source='stream', reason=type(e).__name__)
+            self.connected = False
+            self._stop.wait(self.retry)
+
+    def _lines(self, r):
+        # requests' iter_lines re-splits its whole pending buffer per chunk, which is
+        # quadratic on the multi-megabyte snapshot line; join pieces only at newlines
+        pending = []
+        for chunk in r.iter_content(chunk_size=None):
+            while True:
+                i = chunk.find(b'\n')
+                if i < 0:
+                    pending.append(chunk)
+                    break
+                pending.append(chunk[:i])
+                yield b''.join(pending).decode('utf-8').rstrip('\r')
+                pending = []
+                chunk = chunk[i + 1:]
+
+    def _handle(self, event, data):
+        if event not in ('put', 'patch'):
+            return
+        payload = json.loads(data)
+        path = payload.get('path') or '/'
+        with self.events:
+            self._apply_event(event, path, payload.get('data'))
+            if event == 'put' and path == '/':
+                self.loaded.set()
+
+    def _apply_event(self, event, path, data):
+        parts = [p for p in path.split('/') if p]
+        if event == 'put':
+            if not parts:
+                self._replace(data)
+            else:
+                self._set(parts, data)
+        else:
+            for key, value in (data or {}).items():
+                self._set(parts + [p for p in key.split('/') if p], value)
+
+    def _replace(self, data):
+        # a whole /users tree: users whose hash changed are opened and marked, the rest only keep their encoding
+        data = data if isinstance(data, dict) else {}
+        for uid in [uid for uid in self.hashes if uid not in data]:
+            self.open[uid] = None
+            self._mark(uid)
+        for uid, content in data.items():
+            blob = encode(content)
+            digest = hashlib.sha1(blob).hexdigest()
+            if uid in self.open or digest != self.hashes.get(uid):
+                self.open[uid] = content
+                self._mark(uid)
+            elif uid not in self.raw:
+                # straight after a cache load there are only hashes
+                self.raw[uid] = zlib.compress(blob, 1)
+
+    def _tree(self, uid):
+        # the user's subtree for editing, decoded on first touch since the last flush
+        if uid not in self.open:
+            blob = self.raw.get(uid)
+            self.open[uid] = json.loads(zlib.decompress(blob)) if blob else None
+        return self.open[uid]
+
+    def _seal(self, uid, content):
+        if content is None:
+            self.raw.pop(uid, None)
+            self.hashes.pop(uid, None)
+            return
+        blob = encode(content)
+        self.raw[uid] = zlib.compress(blob, 1)
+        self.hashes[uid] = hashlib.sha1(blob).hexdigest()
+
+    def _set(self, parts, value):
+        tree = self._tree(parts[0])
+        root = {} if tree is None else {parts[0]: tree}
+        node = root
+        trail = []
+        for p in parts[:-1]:
+            child = node.get(p)
+            if not isinstance(child, dict):
+                if value is None:
+                    break
+                child = node[p] = {}
+            trail.append((node, p))
+            node = child
+        else:
+            if value is None:
+                node.pop(parts[-1], None)
+                # RTDB drops empty parents, mirror that
+                for parent, key in reversed(trail):
+                    if parent[key]:
+                        break
+                    del parent[key]
+            else:
+                node[parts[-1]] = value
+        self.open[parts[0]] = root.get(parts[0])
+        if len(parts) >= 3 and parts[1] == 'journal':
+            self._mark(parts[0], parts[2])
+        else:
+            self._mark(parts[0])
+
+    def _mark(self, uid, push_id=None):
+        if push_id is None:
+            self.dirty[uid] = None
+        elif uid not in self.dirty:
+            self.dirty[uid] = {push_id}
+        elif self.dirty[uid] is not None:
+            self.dirty[uid].add(push_id)
+
+    def _flush(self):
+        with self.writer:
+            with self.events:
+                dirty, self.dirty = self.dirty, {}
+                trees, self.open = self.open, {}
+                for uid in dirty:
+                    if uid not in trees:
+                        blob = self.raw.get(uid)
+                        trees[uid] = json.loads(zlib.decompress(blob)) if blob else None
+                    self._seal(uid, trees[uid])
+                hashes = {uid: self.hashes[uid] for uid in dirty if uid in self.hashes}
+                etag = self.etag
+            SYNC_USERS.observe(len(dirty))
+            if not dirty:
+                return
+            # the taken trees are this flush's own now, so rows are built without any lock
+            with TRANSFORM_SECONDS.time(step='rows'):
+                built = {uid: user_rows(uid, trees[uid]) for uid in dirty}
+            del trees
+            users = [b[0] for b in built.values() if b]
+            journals = [r for b in built.values() if b for r in b[1].values()]
+            if not self.user_pos and not len(self.store['journals']):
+                # first load without a cache: fresh columns and indexes, swapped in whole
+                with TRANSFORM_SECONDS.time(step='build'):
+                    fresh = self._build(users, journals)
+                with self.lock:
+                    self._install(*fresh)
+            else:
+                with TRANSFORM_SECONDS.time(step='apply'), self.lock:
+                    for uid, push_ids in dirty.items():
+                        self._apply_user(uid, push_ids, built[uid])
+                    self.version += 1
+                    self.changes.append((self.version,) + self._touched)
+                    self._touched = (set(), set())
+            if self.cache:
+                try:
+                    with TRANSFORM_SECONDS.time(step='cache_save'):
+                        self.cursor = self.cache.save(hashes, users, journals, list(dirty), etag)
+                except Exception as e:
+                    SYNC_ERRORS.inc(source='cache_save', reason=type(e).__name__)
+
+    def _apply_user(self, uid, push_ids, built):
+        # `built` is (user row, {push_id: journal row}) for every entry of the user, None once it is gone
+        self._touched[0].add(uid)
+        if built is None:
+            self._remove_user(uid)
+            return
+        row, journals = built
+        if push_ids is None:
+            push_ids = set(journals) | set(self.user_journals.keys(uid))
+        self._apply_rows(uid, row, {push_id: journals.get(push_id) for push_id in push_ids})
+
+    def _apply_rows(self, uid, row, journals):
+        # `journals` maps push ids to their new rows, None for removed entries
+        cols = self.store['journals']
+        # the rows as indexed, read before set_person renames every entry of this user
+        old = {push_id: cols.row(self.journal_pos[(uid, push_id)]) for push_id in journals if (uid, push_id) in self.journal_pos}
+        if uid in self.user_pos:
+            user = self.store['users'][self.user_pos[uid]]
+            self.user_text.add(uid, row, user)
+            user.update(row)
+        else:
+            self.user_pos[uid] = len(self.store['users'])
+            self.store['users'].append(row)
+            self.user_text.add(uid, row)
+        cols.set_person(uid, row['username'], row['email'])
+        for push_id, journal in journals.items():
+            if journal is None:
+                self._remove_journal(uid, push_id, old.get(push_id))
+            else:
+                self._put_journal(uid, push_id, journal, old.get(push_id))
+
+    def _put_journal(self, uid, push_id, row, old=None):
+        key = (uid, push_id)
+        self._touched[1].add(key)
+        if key in self.journal_pos:
+            pos = self.journal_pos[key]
+            if old is None:
+                old = self.store['journals'].row(pos)
+            self.store['journals'].update(pos, row)
+        else:
+            self.journal_pos[key] = self.store['journals'].append(row)
+        self.journal_ids[push_id] = key
+        self.user_journals.add(uid, push_id, row['date'])
+        self.journal_text.add(key, row, old)
+        self.journal_dates.add(key, day_ordinal(row['date']))
+
+    def _remove_journal(self, uid, push_id, old=None):
+        key = (uid, push_id)
+        self._touched[1].add(key)
+        pos = self.journal_pos.pop(key, None)
+        if self.journal_ids.get(push_id) == key:
+            del self.journal_ids[push_id]
+        self.user_journals.remove(uid, push_id)
+        self.journal_dates.remove(key)
+        if pos is None:
+            return
+        self.journal_text.remove(key, old or self.store['journals'].row(pos))
+        moved = self.store['journals'].remove(pos)
+        if moved:
+            self.journal_pos[moved] = pos
+
+    def _remove_user(self, uid):
+        for push_id in self.user_journals.keys(uid):
+            self._remove_journal(uid, push_id)
+        self.user_journals.drop(uid)
+        pos = self.user_pos.pop(uid, None)
+        if pos is None:
+            return
+        users = self.store['users']
+        self.user_text.remove(uid, users[pos])
+        last = users.pop()
+        if pos < len(users):
+            users[pos] = last
+            self.user_pos[last['uid']] = pos
@@ -0,0 +1,234 @@
+import hashlib
+import io
+import ipaddress
+import json
+import os
+import socket
+import threading
+import time
+import urllib.parse
+from collections import OrderedDict
+
+import requests
+from PIL import Image, ImageOps
+from requests.adapters import HTTPAdapter
+
+THUMB_SIZES = (64, 128, 800)
+MAX_SOURCE_BYTES = 25 * 1024 * 1024
+MAX_REDIRECTS = 5
+
+
+def public_address(url):
+    # True when every address the URL's host resolves to is publicly routable. Source
+    # URLs are written by app users, so without this a journal image could point the
+    # server at loopback, the private network or the cloud metadata endpoint.
+    try:
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            return False
+        infos = socket.getaddrinfo(parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80), proto=socket.IPPROTO_TCP)
+    except (ValueError, OSError):
+        return False
+    for info in infos:
+        ip = ipaddress.ip_address(info[4][0].split('%')[0])
+        if getattr(ip, 'ipv4_mapped', None):
+            ip = ip.ipv4_mapped
+        if not ip.is_global or ip.is_multicast:
+            return False
+    return bool(infos)
+
+
+def thumbnail(data, size):
+    # JPEG no larger than size x size, upright according to the EXIF orientation
+    with Image.open(io.BytesIO(data)) as img:
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((size, size))
+        if img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+        out = io.BytesIO()
+        img.save(out, 'JPEG', quality=82, optimize=True)
+        return out.getvalue()
+
+
+class ImageCache:
+    # Thumbnails of remote images, fetched through one pooled session. Results sit in a
+    # small in-memory LRU in front of a size-bounded LRU directory on disk. Entries
+    # older than `max_age` are revalidated with the source's ETag/Last-Modified, so an
+    # unchanged photo costs a 304 rather than a download and a resize. Only public
+    # addresses are fetched, checked again on every redirect, unless `allow_private`.
+
+    def __init__(self, path, max_bytes=256 * 1024 * 1024, memory_bytes=32 * 1024 * 1024, max_age=86400, allow_private=False):
+        self.path = path
+        self.allow_private = allow_private
+        self.max_bytes = max_bytes
+        self.memory_bytes = memory_bytes
+        self.max_age = max_age
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=16, max_retries=1)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.memory = OrderedDict()
+        self.memory_size = 0
+        self.disk = None
+        self.disk_size = 0
+        self.lock = threading.Lock()
+        self.fetching = {}
+
+    def key(self, url, size):
+        return hashlib.sha1(f'{size}:{url}'.encode()).hexdigest()
+
+    def get(self, url, size):
+        # (jpeg bytes, etag) of the thumbnail, None when the source cannot be fetched or decoded
+        key = self.key(url, size)
+        with self.lock:
+            # concurrent requests for one image share a single fetch
+            fetch_lock = self.fetching.setdefault(key, threading.Lock())
+        with fetch_lock:
+            entry = self._memory_get(key) or self._disk_get(key)
+            if entry is None or time.time() - entry['meta']['checked'] >= self.max_age:
+                entry = self._fetch(key, url, size, entry)
+        with self.lock:
+            self.fetching.pop(key, None)
+        return None if entry is None else (entry['data'], entry['meta']['etag'])
+
+    def _fetch(self, key, url, size, cached):
+        headers = {}
+        if cached and cached['meta'].get('source_etag'):
+            headers['If-None-Match'] = cached['meta']['source_etag']
+        if cached and cached['meta'].get('last_modified'):
+            headers['If-Modified-Since'] = cached['meta']['last_modified']
+        try:
+            r = self._open(url, headers)
+            if r is None:
+                return cached
+            with r:
+                if r.status_code == 304 and cached:
+                    entry = {'data': cached['data'], 'meta': {**cached['meta'], 'checked': time.time()}}
+                    self._store(key, entry)
+                    return entry
+                if r.status_code != 200:
+                    # a stale thumbnail beats a broken image
+                    return cached
+                chunks = []
+                total = 0
+                for chunk in r.iter_content(64 * 1024):
+                    total += len(chunk)
+                    if total > MAX_SOURCE_BYTES:
+                        return cached
+                    chunks.append(chunk)
+                data = thumbnail(b''.join(chunks), size)
+                meta = {
+                    'etag': hashlib.sha1(data).hexdigest()[:16],
+                    'source_etag': r.headers.get('ETag'),
+                    'last_modified': r.headers.get('Last-Modified'),
+                    'checked': time.time(),
+                }
+        except Exception:
+            return cached
+        entry = {'data': data, 'meta': meta}
+        self._store(key, entry)
+        return entry
+
+    def _open(self, url, headers):
+        # follows redirects by hand, so each hop's address is checked before it is requested
+        for _ in range(MAX_REDIRECTS + 1):
+            if not self.allow_private and not public_address(url):
+                return None
+            r = self.session.get(url, headers=headers, timeout=(5, 20), stream=True, allow_redirects=False)
+            if not r.is_redirect:
+                return r
+            url = urllib.parse.urljoin(url, r.headers['Location'])
+            r.close()
+        return None
+
+    def _memory_get(self, key):
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None:
+                self.memory.move_to_end(key)
+            return entry
+
+    def _remember(self, key, entry):
+        old = self.memory.pop(key, None)
+        if old is not None:
+            self.memory_size -= len(old['data'])
+        self.memory[key] = entry
+        self.memory_size += len(entry['data'])
+        while self.memory_size > self.memory_bytes and len(self.memory) > 1:
+            _, dropped = self.memory.popitem(last=False)
+            self.memory_size -= len(dropped['data'])
+
+    def _files(self, key):
+        return os.path.join(self.path, key + '.jpg'), os.path.join(self.path, key + '.json')
+
+    def _scan(self):
+        # disk index {key: [bytes, last used]}, rebuilt from file mtimes on first use
+        if self.disk is not None:
+            return
+        self.disk = {}
+        self.disk_size = 0
+        os.makedirs(self.path, exist_ok=True)
+        for name in os.listdir(self.path):
+            if not name.endswith('.jpg'):
+                continue
+            try:
+                st = os.stat(os.path.join(self.path, name))
+            except OSError:
+                continue
+            self.disk[name[:-4]] = [st.st_size, st.st_mtime]
+            self.disk_size += st.st_size
+
+    def _disk_get(self, key):
+        image_path, meta_path = self._files(key)
+        with self.lock:
+            self._scan()
+            if key not in self.disk:
+                return None
+        try:
+            with open(image_path, 'rb') as f:
+                data = f.read()
+            with open(meta_path) as f:
+                meta = json.load(f)
+            now = time.time()
+            os.utime(image_path, (now, now))
+        except (OSError, ValueError):
+            return None
+        entry = {'data': data, 'meta': meta}
+        with self.lock:
+            if key in self.disk:
+                self.disk[key][1] = now
+            self._remember(key, entry)
+        return entry
+
+    def _store(self, key, entry):
+        image_path, meta_path = self._files(key)
+        with self.lock:
+            self._remember(key, entry)
+            self._scan()
+        try:
+            for path, content, mode in ((image_path, entry['data'], 'wb'), (meta_path, json.dumps(entry['meta']), 'w')):
+                tmp = f'{path}.{threading.get_ident()}.tmp'
+                with open(tmp, mode) as f:
+                    f.write(content)
+                os.replace(tmp, path)
+        except OSError:
+            return
+        with self.lock:
+            old = self.disk.get(key)
+            self.disk_size += len(entry['data']) - (old[0] if old else 0)
+            self.disk[key] = [len(entry['data']), time.time()]
+            if self.disk_size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # drop least recently used files down to 90% of the budget, so eviction is not per write
+        for key in sorted(self.disk, key=lambda k: self.disk[k][1]):
+            if self.disk_size <= self.max_bytes * 0.9:
+                break
+            size, _ = self.disk.pop(key)
+            self.disk_size -= size
+            for path in self._files(key):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
@@ -0,0 +1,373 @@
+import array
+import bisect
+import datetime
+import sys
+import threading
+from operator import itemgetter
+
+
+def day_ordinal(iso):
+    # rows carry ISO dates already normalised by parse_date, so this is a cheap parse
+    try:
+        return datetime.date.fromisoformat(iso[:10]).toordinal()
+    except (TypeError, ValueError):
+        return None
+
+
+def grams(token):
+    return {token[i:i + 3] for i in range(len(token) - 2)}
+
+
+# members a name keeps in a list before switching to a set
+SMALL = 16
+
+
+def link(index, name, value):
+    # adds `value` under `name`. Most tokens and trigrams belong to one or a few rows or
+    # tokens, so a lone value is kept bare and a few in a list, which are far smaller than
+    # sets. Values are strings or tuples, never lists. True for a new name.
+    values = index.get(name)
+    if values is None:
+        index[name] = value
+        return True
+    if isinstance(values, set):
+        values.add(value)
+    elif isinstance(values, list):
+        if value not in values:
+            if len(values) < SMALL:
+                values.append(value)
+            else:
+                index[name] = {*values, value}
+    elif values != value:
+        index[name] = [values, value]
+    return False
+
+
+def unlink(index, name, value):
+    # removes `value` from under `name`; True when nothing is left there
+    values = index.get(name)
+    if isinstance(values, (set, list)):
+        if value in values:
+            values.remove(value)
+        if len(values) == 1:
+            index[name] = next(iter(values))
+        elif not values:
+            del index[name]
+            return True
+        return False
+    if values is None or values != value:
+        return False
+    del index[name]
+    return True
+
+
+def members(values):
+    return values if isinstance(values, (set, list)) else () if values is None else (values,)
+
+
+class TextIndex:
+    # Inverted index for substring search over a few text fields. Every whitespace
+    # token maps to the keys of the rows containing it, and a trigram index over the
+    # (much smaller) token vocabulary finds the tokens containing a query term. A query
+    # matches a row when each of its terms is a substring of one of the row's tokens,
+    # which is the same as `term in field` for terms without spaces. Short fields are
+    # also indexed whole so terms spanning their punctuation still hit.
+    #
+    # Rows are not kept: callers hand in the previous row on update and removal, so its
+    # tokens can be unlinked. A bulk load is only queued and indexed on first use.
+
+    def __init__(self, fields, whole_fields=()):
+        self.fields = fields
+        self.whole_fields = whole_fields
+        self.postings = {}
+        self.trigrams = {}
+        # (key, row) pairs of a bulk load that are not indexed yet
+        self.pending = None
+        self.lock = threading.Lock()
+
+    def tokens(self, row):
+        out = set()
+        if not row:
+            return out
+        for f in self.fields:
+            value = row.get(f)
+            if not value:
+                continue
+            value = str(value).lower()
+            out.update(value.split())
+            if f in self.whole_fields:
+                out.add(value)
+        return out
+
+    def load(self, rows):
+        # replaces the contents with `rows`, (key, row) pairs that must not change until indexed
+        with self.lock:
+            self.postings = {}
+            self.trigrams = {}
+            self.pending = rows
+
+    def settle(self):
+        with self.lock:
+            self._settle()
+
+    def _settle(self):
+        rows, self.pending = self.pending, None
+        if rows is None:
+            return
+        postings = self.postings
+        for key, row in rows:
+            for token in self.tokens(row):
+                link(postings, token, key)
+        trigrams = self.trigrams
+        for token in postings:
+            for g in grams(token):
+                link(trigrams, g, token)
+
+    def add(self, key, row, old=None):
+        # `old` is the row as last indexed under `key`, None for a new key
+        new = self.tokens(row)
+        old = self.tokens(old)
+        if new == old:
+            return
+        with self.lock:
+            self._settle()
+            for token in old - new:
+                self._unlink(token, key)
+            for token in new - old:
+                if link(self.postings, token, key):
+                    for g in grams(token):
+                        link(self.trigrams, g, token)
+
+    def remove(self, key, row):
+        # `row` is the row as last indexed under `key`
+        tokens = self.tokens(row)
+        with self.lock:
+            self._settle()
+            for token in tokens:
+                self._unlink(token, key)
+
+    def clear(self):
+        self.load(None)
+
+    def nbytes(self):
+        # rough footprint of the two maps, their sets and the tokens; keys are shared with the store
+        with self.lock:
+            size = sys.getsizeof(self.postings) + sys.getsizeof(self.trigrams)
+            size += sum(sys.getsizeof(t) + (sys.getsizeof(keys) if isinstance(keys, (set, list)) else 0) for t, keys in self.postings.items())
+            size += sum(sys.getsizeof(g) + (sys.getsizeof(tokens) if isinstance(tokens, (set, list)) else 0) for g, tokens in self.trigrams.items())
+        return size
+
+    def _unlink(self, token, key):
+        if unlink(self.postings, token, key):
+            for g in grams(token):
+                unlink(self.trigrams, g, token)
+
+    def _matching_tokens(self, term):
+        if len(term) < 3:
+            return [t for t in self.postings if term in t]
+        candidates = None
+        for g in sorted(grams(term), key=lambda g: len(members(self.trigrams.get(g)))):
+            tokens = members(self.trigrams.get(g))
+            if not tokens:
+                return []
+            candidates = set(tokens) if candidates is None else candidates.intersection(tokens)
+            if not candidates:
+                return []
+        return [t for t in candidates if term in t]
+
+    def match(self, term):
+        # keys of the rows with a token containing `term`, a single lowercase word
+        with self.lock:
+            self._settle()
+            return self._match(term)
+
+    def _match(self, term):
+        tokens = self._matching_tokens(term)
+        if len(tokens) == 1:
+            return set(members(self.postings[tokens[0]]))
+        return set().union(*(members(self.postings[t]) for t in tokens))
+
+    def search(self, query):
+        # keys of the rows matching every term of `query`; None for an empty query
+        terms = (query or '').lower().split()
+        if not terms:
+            return None
+        result = None
+        with self.lock:
+            self._settle()
+            for term in sorted(set(terms), key=len, reverse=True):
+                keys = self._match(term)
+                result = keys if result is None else result & keys
+                if not result:
+                    return set()
+        return result
+
+
+class DateIndex:
+    # Row keys sorted by day ordinal, so a date range is two bisects. The ordinals sit in
+    # a typed array with the keys in a parallel list, rather than a tuple per row. Changes
+    # are queued and folded in on the next query: a handful are inserted in place, a large
+    # batch (first load) triggers one re-sort instead.
+
+    def __init__(self):
+        self.days = {}
+        self.ordinals = array.array('i')
+        self.keys = []
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def add(self, key, day):
+        with self.lock:
+            self.pending[key] = day
+
+    def remove(self, key):
+        with self.lock:
+            self.pending[key] = None
+
+    def clear(self):
+        self.load(())
+
+    def load(self, pairs):
+        # replaces the contents with (key, day) pairs, sorted on the first query
+        with self.lock:
+            self.days = {}
+            self.ordinals = array.array('i')
+            self.keys = []
+            self.pending = dict(pairs)
+
+    def settle(self):
+        with self.lock:
+            if self.pending:
+                self._settle()
+
+    def nbytes(self):
+        # rough footprint of the day map and the sorted arrays; keys are shared
+        with self.lock:
+            return sum(map(sys.getsizeof, (self.days, self.ordinals, self.keys, self.pending)))
+
+    def _settle(self):
+        pending, self.pending = self.pending, {}
+        if len(pending) * 16 > len(self.keys):
+            for key, day in pending.items():
+                if day is None:
+                    self.days.pop(key, None)
+                else:
+                    self.days[key] = day
+            entries = sorted(self.days.items(), key=itemgetter(1))
+            self.ordinals = array.array('i', [day for _, day in entries])
+            self.keys = [key for key, _ in entries]
+            return
+        ordinals, keys = self.ordinals, self.keys
+        for key, day in pending.items():
+            old = self.days.get(key)
+            if old == day:
+                continue
+            if old is not None:
+                i = keys.index(key, bisect.bisect_left(ordinals, old), bisect.bisect_right(ordinals, old))
+                del ordinals[i]
+                del keys[i]
+                del self.days[key]
+            if day is not None:
+                i = bisect.bisect_right(ordinals, day)
+                ordinals.insert(i, day)
+                keys.insert(i, key)
+                self.days[key] = day
+
+    def select(self, start=None, end=None, keys=None):
+        # keys dated within [start, end] (ordinals, either may be None); undated rows never
+        # match. With `keys`, only those are considered, walking whichever side is smaller.
+        with self.lock:
+            if self.pending:
+                self._settle()
+            lo = 0 if start is None else bisect.bisect_left(self.ordinals, start)
+            hi = len(self.keys) if end is None else bisect.bisect_right(self.ordinals, end)
+            if keys is not None and len(keys) < hi - lo:
+                start = -1 if start is None else start
+                end = float('inf') if end is None else end
+                days = self.days
+                return {k for k in keys if k in days and start <= days[k] <= end}
+            found = set(self.keys[lo:hi])
+        return found if keys is None else found & set(keys)
+
+
+class GroupIndex:
+    # Keys grouped by owner (journal push ids per uid), each group ordered by a value
+    # such as the entry date, so one owner's newest entries are a slice instead of a
+    # scan over every row. A changed group is re-sorted on its next read, which keeps
+    # bulk loads linear and costs only that group's size afterwards.
+
+    def __init__(self):
+        self.values = {}
+        self.orders = {}
+        self.stale = set()
+        self.lock = threading.Lock()
+
+    def __contains__(self, group):
+        return group in self.values
+
+    def count(self, group):
+        return len(self.values.get(group, ()))
+
+    def keys(self, group):
+        with self.lock:
+            return list(self.values.get(group, ()))
+
+    def add(self, group, key, value):
+        with self.lock:
+            values = self.values.setdefault(group, {})
+            if key in values and values[key] == value:
+                return
+            values[key] = value
+            self.stale.add(group)
+
+    def load(self, entries):
+        # replaces the contents with (group, key, value) triples; each group sorts on its first read
+        values = {}
+        for group, key, value in entries:
+            values.setdefault(group, {})[key] = value
+        with self.lock:
+            self.values = values
+            self.orders = {}
+            self.stale = set(values)
+
+    def remove(self, group, key):
+        with self.lock:
+            values = self.values.get(group)
+            if values is None or key not in values:
+                return
+            del values[key]
+            self.stale.add(group)
+
+    def drop(self, group):
+        with self.lock:
+            self.values.pop(group, None)
+            self.orders.pop(group, None)
+            self.stale.discard(group)
+
+    def clear(self):
+        with self.lock:
+            self.values.clear()
+            self.orders.clear()
+            self.stale.clear()
+
+    def nbytes(self):
+        # rough footprint of the per-group value maps and sorted orders; keys are shared
+        with self.lock:
+            size = sys.getsizeof(self.values) + sys.getsizeof(self.orders)
+            size += sum(sys.getsizeof(v) for v in self.values.values())
+            size += sum(sys.getsizeof(o) for o in self.orders.values())
+        return size
+
+    def page(self, group, offset=0, limit=None, descending=True):
+        # keys of one group ordered by value (ties by key), newest first by default
+        with self.lock:
+            if group in self.stale:
+                self.stale.discard(group)
+                values = self.values.get(group, {})
+                self.orders[group] = sorted(values, key=lambda k: (values[k], k))
+            order = self.orders.get(group, [])
+            if descending:
+                hi = len(order) - offset
+                lo = 0 if limit is None else max(0, hi - limit)
+                return order[lo:max(0, hi)][::-1]
+            return order[offset:None if limit is None else offset + limit]
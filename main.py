@@ -1,138 +1,453 @@
-from nicegui import ui, app
-import requests
+from nicegui import Client, background_tasks, ui, app, run
+import asyncio
 import datetime
-import io
-import csv
+import hmac
+import importlib
+import json
 import re
 import os
+import time
+import urllib.parse
 from dotenv import load_dotenv
+import socket
+import uuid
+from fastapi import HTTPException, Request
+from fastapi.responses import RedirectResponse, Response, StreamingResponse
 
 load_dotenv(override=True)
 
-FIREBASE_URL = 'https://mad-mental-default-rtdb.asia-southeast1.firebasedatabase.app'
-
-
-def fetch_users():
-    try:
-        r = requests.get(f'{FIREBASE_URL}/users.json', timeout=15)
-        if r.status_code == 200:
-            data = r.json() or {}
-            return data
-        return {}
-    except Exception:
-        return {}
-
-
-def transform_users(data):
-    rows = []
-    for uid, content in (data or {}).items():
-        profile = (content or {}).get('profile') or {}
-        journal = (content or {}).get('journal') or {}
-        rows.append({
-            'uid': uid,
-            'username': profile.get('Username') or '',
-            'email': profile.get('Email') or '',
-            'photo': profile.get('PhotoUrl') or '',
-            'journals': len(journal),
-        })
-    return rows
-
-
-def transform_journals(data):
-    rows = []
-    for uid, content in (data or {}).items():
-        profile = (content or {}).get('profile') or {}
-        username = profile.get('Username') or ''
-        email = profile.get('Email') or ''
-        journal = (content or {}).get('journal') or {}
-        for push_id, entry in journal.items():
-            mood = entry.get('Mood')
-            summary = entry.get('Summary') or ''
-            date_raw = entry.get('Date') or ''
-            dt = parse_date(date_raw)
-            date = dt.isoformat() if dt else (date_raw[:10] if isinstance(date_raw, str) and len(date_raw) >= 10 else '')
-            image = entry.get('ImagePath') or ''
-            rows.append({
-                'uid': uid,
-                'push_id': push_id,
-                'username': username,
-                'email': email,
-                'mood': mood,
-                'summary': summary,
-                'date': date,
-                'image': image,
-            })
-    return rows
-
-
-def parse_date(s):
-    try:
-        if not s:
-            return None
-        ss = str(s).strip().strip('`')
-        if not ss:
-            return None
-        ss = ss.replace('Z', '+00:00')
-        try:
-            return datetime.datetime.fromisoformat(ss).date()
-        except Exception:
-            pass
-        for fmt in ('%Y-%m-%d', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%dT%H:%M:%S.%f'):
-            try:
-                return datetime.datetime.strptime(ss, fmt).date()
-            except Exception:
-                continue
-        if len(ss) >= 10:
-            try:
-                return datetime.datetime.strptime(ss[:10], '%Y-%m-%d').date()
-            except Exception:
-                return None
-        return None
-    except Exception:
-        return None
-
-
-store = {'users': [], 'journals': []}
+import metrics
+from analytics import Analytics
+from auth import STORAGE_SECRET, SessionStore, check_credentials, require_secret
+from columnar import JournalColumns
+from export import BATCH, FORMATS, batched, export_chunks, export_options
+from firebase import FirebaseSync, parse_date
+from images import THUMB_SIZES, ImageCache
+from scheduler import RefreshScheduler
+from sessions import Sessions
+from snapshot_cache import SnapshotCache
+from tables import PAGE_SIZE, PAGE_SIZE_OPTIONS, TableQuery
+
+
+require_secret()
+
+store = {'users': [], 'journals': JournalColumns()}
+
+FILTER_SECONDS = metrics.histogram('filter_seconds', 'Search, date filter and paging latency, by table and step')
+ROWS_PUSHED = metrics.counter('table_rows_pushed_total', 'Table rows sent to browsers, by table')
+PAYLOAD_BYTES = metrics.histogram('ws_payload_bytes', 'Approximate JSON size of table and chart updates sent over the websocket, by element', metrics.SIZE_BUCKETS)
+EXPORT_SECONDS = metrics.histogram('export_seconds', 'Export duration, by table and format')
+EXPORT_BYTES = metrics.counter('export_bytes_total', 'Bytes streamed by exports, by table and format')
+EXPORT_ROWS = metrics.counter('export_rows_total', 'Rows streamed by exports, by table and format')
+profiler = metrics.Profiler()
 last_fetch_ok = True
+data_ready = False
+last_good_at = None
+refresh_task = None
 
 
 def is_http(url):
     return isinstance(url, str) and re.match(r'^https?://', url or '') is not None
 
 
-def download_csv(rows, columns, filename):
-    buf = io.StringIO()
-    writer = csv.writer(buf)
-    writer.writerow([c['label'] for c in columns])
-    for r in rows:
-        writer.writerow([r.get(c['field']) for c in columns])
-    ui.download(buf.getvalue().encode('utf-8'), filename)
+def format_age(seconds):
+    if seconds < 60:
+        return 'just now'
+    if seconds < 3600:
+        return f'{int(seconds // 60)} min ago'
+    if seconds < 86400:
+        return f'{int(seconds // 3600)} h ago'
+    return f'{int(seconds // 86400)} d ago'
+
+
+users_columns = [
+    {'name': 'uid', 'label': 'UID', 'field': 'uid', 'sortable': True},
+    {'name': 'username', 'label': 'Username', 'field': 'username', 'sortable': True},
+    {'name': 'email', 'label': 'Email', 'field': 'email', 'sortable': True},
+    {'name': 'journals', 'label': 'Journals', 'field': 'journals', 'sortable': True},
+]
+journals_columns = [
+    {'name': 'date', 'label': 'Date', 'field': 'date', 'sortable': True},
+    {'name': 'username', 'label': 'Username', 'field': 'username', 'sortable': True},
+    {'name': 'email', 'label': 'Email', 'field': 'email', 'sortable': True},
+    {'name': 'mood', 'label': 'Mood', 'field': 'mood', 'sortable': True},
+    {'name': 'summary', 'label': 'Summary', 'field': 'summary', 'sortable': False},
+    {'name': 'image', 'label': 'ImagePath', 'field': 'image', 'sortable': False},
+]
+# what the tables and exports accept as a sort: the sortable columns, by the name Quasar sends
+SORTABLE = {
+    'users': {c['name'] for c in users_columns if c['sortable']},
+    'journals': {c['name'] for c in journals_columns if c['sortable']},
+}
+# table-only column, rendered by a slot from the image proxy; exports keep the plain path
+thumb_column = {'name': 'thumb', 'label': '', 'field': 'image', 'sortable': False}
+
+
+# With SHARED_SNAPSHOT=1 several workers on one host point SNAPSHOT_CACHE at one file:
+# the lease holder streams from Firebase and writes it, the others only read it.
+SHARED_SNAPSHOT = os.getenv('SHARED_SNAPSHOT', '').lower() in ('1', 'true', 'yes')
+LEADER_TTL = max(3.0, float(os.getenv('LEADER_TTL', 90)))
+NODE_ID = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+is_leader = not SHARED_SNAPSHOT
+
+
+def backend(setting, default):
+    # class named 'module:Class' by `setting`, e.g. a networked store with the same methods as
+    # the SQLite one it replaces; it is built from the same path or URL setting
+    name = os.getenv(setting)
+    if not name:
+        return default
+    module, _, attr = name.partition(':')
+    return getattr(importlib.import_module(module), attr)
+
+
+sync = FirebaseSync(store, cache=backend('SNAPSHOT_BACKEND', SnapshotCache)(os.getenv('SNAPSHOT_CACHE', '.cache/snapshot.sqlite3')))
+
+
+sessions = Sessions(sync)
+
+
+async def load_cached_snapshot():
+    global data_ready, last_good_at
+    # the SQLite read and index build run off the event loop, so pages are served meanwhile
+    saved_at = await run.io_bound(sync.load_cache)
+    if saved_at:
+        last_good_at = saved_at
+        data_ready = True
+        sessions.publish()
+        # the search indexes are built after the first render instead of before it
+        await run.io_bound(sync.settle)
 
 
 def reload_data():
-    global last_fetch_ok
-    data = fetch_users()
-    last_fetch_ok = bool(data)
-    store['users'] = transform_users(data)
-    store['journals'] = transform_journals(data)
-
-
-reload_data()
+    global last_fetch_ok, data_ready, last_good_at, is_leader
+    if SHARED_SNAPSHOT:
+        try:
+            is_leader = sync.cache.acquire(NODE_ID, LEADER_TTL)
+        except Exception:
+            is_leader = False
+        if not is_leader:
+            checked_at = sync.follow()
+            last_fetch_ok = checked_at is not None
+            if last_fetch_ok:
+                last_good_at = checked_at
+                data_ready = True
+            return
+    # a failed sync leaves the store untouched, so pages keep the last good snapshot
+    last_fetch_ok = sync.sync()
+    if last_fetch_ok:
+        last_good_at = time.time()
+        if SHARED_SNAPSHOT:
+            try:
+                sync.cache.touch()
+            except Exception:
+                pass
+    data_ready = True
 
 
-users_table = None
-journals_table = None
+async def keep_lease():
+    # renews the lease (or takes it over) on its own clock, since refreshes may be
+    # backing off for longer than LEADER_TTL or not scheduled at all
+    global is_leader
+    while True:
+        await asyncio.sleep(LEADER_TTL / 3)
+        was_leader = is_leader
+        try:
+            is_leader = await run.io_bound(sync.cache.acquire, NODE_ID, LEADER_TTL)
+        except Exception:
+            is_leader = False
+        if was_leader and not is_leader:
+            sync.stop()
+        elif is_leader and not was_leader:
+            asyncio.ensure_future(refresh_data())
+
+
+def release_leader():
+    if SHARED_SNAPSHOT and is_leader:
+        sync.stop()
+        sync.cache.release(NODE_ID)
+
+
+async def refresh_data():
+    global refresh_task
+    # concurrent callers join the refresh already in flight instead of starting another
+    if refresh_task is None or refresh_task.done():
+        refresh_task = asyncio.ensure_future(run.io_bound(reload_data))
+    await asyncio.shield(refresh_task)
+    sessions.publish()
+    await run.io_bound(sync.settle)
+    return last_fetch_ok
+
+
+users_query = TableQuery(lambda: store['users'], lambda: sync.version)
+journals_query = TableQuery(lambda: store['journals'], lambda: sync.version)
+analytics = Analytics(store['journals'], lambda: sync.version)
+scheduler = RefreshScheduler(refresh_data)
+
+
+PROFILE_PAGE = 8
+
+
+def show_rows(table, rows, pagination, name):
+    # only re-sends the table when its visible page or counts actually changed
+    if rows != table.rows:
+        table.update_rows(rows, clear_selection=False)
+        ROWS_PUSHED.inc(len(rows), table=name)
+        PAYLOAD_BYTES.observe(len(json.dumps(rows, default=str)), element='table')
+    if pagination != table.pagination:
+        table.pagination = pagination
+
+
+def patch_chart(chart, values):
+    # values: (container, key, value) triples inside chart.options; unchanged charts are not re-sent
+    changed = False
+    for target, key, value in values:
+        if target.get(key) != value:
+            target[key] = value
+            changed = True
+    if changed:
+        chart.update()
+        PAYLOAD_BYTES.observe(len(json.dumps(chart.options, default=str)), element='chart')
+
+
+def user_matches(query):
+    # positions in store['users'] matching a search, None when unfiltered
+    with FILTER_SECONDS.time(table='users', step='search'):
+        keys = sync.user_text.search(query)
+        return None if keys is None else [sync.user_pos[k] for k in keys if k in sync.user_pos]
+
+
+def journal_matches(query, start=None, end=None):
+    # positions in store['journals'] matching a search and date range, None when unfiltered
+    with FILTER_SECONDS.time(table='journals', step='search'):
+        keys = sync.search_journals(query)
+    if start or end:
+        with FILTER_SECONDS.time(table='journals', step='dates'):
+            keys = sync.journal_dates.select(start.toordinal() if start else None, end.toordinal() if end else None, keys)
+    return None if keys is None else [sync.journal_pos[k] for k in keys if k in sync.journal_pos]
+
+
+# The page helpers below take sync.lock, which a flush holds while it applies a batch of
+# changes, so pages call them through run.io_bound and the event loop never waits for it.
+
+def users_page(view, query):
+    # (rows, total, page) of the Users table for a view's search and pagination
+    p = view['pagination']
+    with sync.lock:
+        # matches are positions, so they are only good for the version they were taken at
+        if view['version'] != sync.version:
+            view['matches'] = user_matches(query)
+            view['version'] = sync.version
+        with FILTER_SECONDS.time(table='users', step='page'):
+            rows, total, page = users_query.page(view['matches'], p.get('sortBy'), p.get('descending'), p.get('page') or 1, p.get('rowsPerPage'))
+        # copies, since the store updates user dicts in place
+        return [dict(r) for r in rows], total, page
+
+
+def journals_page(view, query, start, end):
+    # (rows, total, page, all rows) of the Journals table for a view's filters and pagination
+    p = view['pagination']
+    with sync.lock:
+        if view['version'] != sync.version:
+            view['matches'] = journal_matches(query, start, end)
+            view['version'] = sync.version
+        with FILTER_SECONDS.time(table='journals', step='page'):
+            rows, total, page = journals_query.page(view['matches'], p.get('sortBy'), p.get('descending'), p.get('page') or 1, p.get('rowsPerPage'))
+        return rows, total, page, len(store['journals'])
+
+
+def user_by_uid(uid):
+    with sync.lock:
+        pos = sync.user_pos.get(uid)
+        return dict(store['users'][pos]) if pos is not None and pos < len(store['users']) else None
+
+
+def user_options():
+    with sync.lock:
+        return {u['uid']: u['username'] or u['uid'] for u in store['users']}
+
+
+def rows_by_key(table, keys):
+    # current rows for `keys`, a batch per lock hold; entries removed meanwhile are skipped
+    for batch in batched(keys, BATCH):
+        with sync.lock:
+            if table == 'users':
+                users = store['users']
+                rows = [dict(users[pos]) for pos in map(sync.user_pos.get, batch) if pos is not None]
+            else:
+                journals = store['journals']
+                rows = [journals.row(pos) for pos in map(sync.journal_pos.get, batch) if pos is not None]
+        yield from rows
 
 
-def check_credentials(email, password):
-    admin_email = os.getenv('ADMIN_EMAIL')
-    admin_password = os.getenv('ADMIN_PASSWORD')
-    return bool(admin_email and admin_password and email == admin_email and password == admin_password)
+def measured(chunks, table, fmt):
+    # passes export chunks through while counting them
+    start = time.perf_counter()
+    try:
+        for chunk in chunks:
+            EXPORT_BYTES.inc(len(chunk), table=table, format=fmt)
+            yield chunk
+    finally:
+        EXPORT_SECONDS.observe(time.perf_counter() - start, table=table, format=fmt)
+
+
+def counted(rows, table, fmt):
+    n = 0
+    for row in rows:
+        n += 1
+        yield row
+    EXPORT_ROWS.inc(n, table=table, format=fmt)
+
+
+def export_url(table, fmt, gzip, **params):
+    params = {k: v for k, v in params.items() if v}
+    params['format'] = fmt
+    if gzip:
+        params['gzip'] = 1
+    return f'/export/{table}?{urllib.parse.urlencode(params)}'
+
+
+def export_menu(on_export):
+    with ui.dropdown_button('Export', auto_close=True).props('unelevated'):
+        for fmt, gzip, label in export_options():
+            ui.item(label, on_click=lambda fmt=fmt, gzip=gzip: on_export(fmt, gzip))
+
+
+@app.get('/export/{table}')
+def export_table(table: str, format: str = 'csv', gzip: bool = False, q: str = '', start: str = '', end: str = '', sort: str = '', desc: bool = False):
+    # streams the filtered, sorted table chunk by chunk; runs in Starlette's threadpool
+    if not is_authed():
+        raise HTTPException(status_code=401)
+    if format not in FORMATS or (gzip and format == 'parquet'):
+        raise HTTPException(status_code=400, detail='unsupported format')
+    if table == 'users':
+        query, columns = users_query, users_columns
+        fields = ('uid', 'username', 'email', 'photo', 'journals')
+    elif table == 'journals':
+        query, columns = journals_query, journals_columns
+        fields = JournalColumns.FIELDS
+    else:
+        raise HTTPException(status_code=404)
+    if sort and sort not in SORTABLE[table]:
+        raise HTTPException(status_code=400, detail='unsupported sort')
+    # the export is fixed to the rows and order of this moment by key, since positions
+    # shift when a refresh lands while the response is still streaming
+    with sync.lock:
+        if table == 'users':
+            users = store['users']
+            keys = [users[i]['uid'] for i in query.select(user_matches(q), sort or None, desc)]
+        else:
+            journals = store['journals']
+            keys = [journals.key(i) for i in query.select(journal_matches(q, parse_date(start), parse_date(end)), sort or None, desc)]
+    chunks = export_chunks(counted(rows_by_key(table, keys), table, format), format, columns, fields,
+                           {'mood': 'float64', 'journals': 'int64'}, gzip)
+    chunks = measured(chunks, table, format)
+    media_type, ext = FORMATS[format]
+    filename = f'{table}.{ext}' + ('.gz' if gzip else '')
+    return StreamingResponse(chunks, media_type='application/gzip' if gzip else media_type,
+                             headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+
+images = ImageCache(
+    os.getenv('IMAGE_CACHE', '.cache/images'),
+    max_bytes=int(float(os.getenv('IMAGE_CACHE_MB', 256)) * 1024 * 1024),
+    memory_bytes=int(float(os.getenv('IMAGE_MEMORY_MB', 32)) * 1024 * 1024),
+    max_age=float(os.getenv('IMAGE_MAX_AGE', 86400)),
+    allow_private=os.getenv('IMAGE_ALLOW_PRIVATE', '').lower() in ('1', 'true', 'yes'),
+)
+
+
+memory_estimate = {'version': None, 'bytes': {}}
+
+
+def snapshot_memory():
+    # estimated once per snapshot version, since it walks every row, index entry and raw subtree
+    version = sync.version
+    if memory_estimate['version'] != version:
+        memory_estimate['bytes'] = {(('part', part),): size for part, size in sync.nbytes().items()}
+        memory_estimate['version'] = version
+    return memory_estimate['bytes']
+
+
+metrics.gauge('snapshot_memory_bytes', 'Estimated memory held by the in-process snapshot: rows, position maps, indexes and raw subtrees, by part', snapshot_memory)
+metrics.gauge('snapshot_rows', 'Rows in the snapshot, by table', lambda: {(('table', 'users'),): len(store['users']), (('table', 'journals'),): len(store['journals'])})
+metrics.gauge('snapshot_version', 'Snapshot version this process is serving', lambda: sync.version)
+metrics.gauge('snapshot_age_seconds', 'Seconds since the last good refresh', lambda: time.time() - last_good_at if last_good_at else float('nan'))
+metrics.gauge('sessions_open', 'Dashboard pages subscribed to snapshot updates', lambda: len(sessions))
+metrics.gauge('leader', '1 when this worker owns the Firebase connection', lambda: int(is_leader))
+metrics.gauge('image_cache_bytes', 'Thumbnail cache size, by tier', lambda: {(('tier', 'memory'),): images.memory_size, (('tier', 'disk'),): images.disk_size})
+
+
+@app.get('/metrics')
+def metrics_endpoint(request: Request):
+    # scrapers authenticate with METRICS_TOKEN; without one set, an admin session is required
+    token = os.getenv('METRICS_TOKEN')
+    if token:
+        if not hmac.compare_digest(request.headers.get('authorization', ''), f'Bearer {token}'):
+            raise HTTPException(status_code=401)
+    elif not is_authed():
+        raise HTTPException(status_code=401)
+    return Response(metrics.render(), media_type='text/plain; version=0.0.4')
+
+
+def image_url(kind, key, size):
+    return f"/images/{kind}/{urllib.parse.quote(key, safe='')}?size={size}"
+
+
+@app.get('/images/{kind}/{key}')
+def image(kind: str, key: str, request: Request, size: int = 128):
+    # thumbnail of a journal image or user photo. The source URL comes from the store, so a
+    # request only picks a stored image; the URLs themselves are user-written, and
+    # ImageCache refuses private, loopback and link-local hosts, on every redirect too
+    if not is_authed():
+        raise HTTPException(status_code=401)
+    if size not in THUMB_SIZES:
+        raise HTTPException(status_code=400, detail='unsupported size')
+    if kind == 'journal':
+        row = sync.journal(key)
+        url = row and row.get('image')
+    elif kind == 'user':
+        with sync.lock:
+            pos = sync.user_pos.get(key)
+            url = store['users'][pos].get('photo') if pos is not None and pos < len(store['users']) else None
+    else:
+        raise HTTPException(status_code=404)
+    if not is_http(url):
+        raise HTTPException(status_code=404)
+    result = images.get(url, size)
+    if result is None:
+        raise HTTPException(status_code=502, detail='image unavailable')
+    data, etag = result
+    headers = {'ETag': f'"{etag}"', 'Cache-Control': 'private, max-age=3600'}
+    if request.headers.get('if-none-match') == headers['ETag']:
+        return Response(status_code=304, headers=headers)
+    return Response(data, media_type='image/jpeg', headers=headers)
+
+
+async def start_refresh():
+    # the first refresh waits for the cached snapshot, so it only has to fetch the difference
+    await load_cached_snapshot()
+    await scheduler.run()
+
+
+# coroutines run as background tasks, so startup does not wait for either
+app.on_startup(start_refresh)
+if SHARED_SNAPSHOT:
+    app.on_startup(keep_lease)
+app.on_shutdown(release_leader)
+
+
+logins = backend('SESSION_BACKEND', SessionStore)(os.getenv('SESSION_STORE', '.cache/sessions.sqlite3'))
+
+
+def is_authed():
+    # the cookie only names a session; whether it is logged in is decided by the shared store
+    return logins.email(app.storage.browser.get('session')) is not None
 
 
 @ui.page('/login')
 def login_page():
-    if app.storage.user.get('authed'):
+    if is_authed():
         ui.navigate.to('/')
         return
     with ui.column().classes('w-full items-center justify-center min-h-screen'):
@@ -144,45 +459,77 @@ def login_page():
                 email = (email_in.value or '').strip()
                 pwd = pass_in.value or ''
                 if check_credentials(email, pwd):
-                    app.storage.user['authed'] = True
-                    app.storage.user['email'] = email
-                    ui.notify('Login successful', color='positive')
-                    ui.navigate.to('/')
+                    ui.navigate.to('/session?' + urllib.parse.urlencode({'token': logins.issue_token(email)}))
                 else:
                     ui.notify('Invalid credentials', color='negative')
             ui.button('Login', on_click=do_login).props('unelevated color=primary').classes('w-full')
 
 
+@ui.page('/session')
+def session_page(token: str = ''):
+    # page requests may still set cookies, unlike the login form's click handler
+    email = logins.redeem_token(token)
+    if not email:
+        return RedirectResponse('/login')
+    app.storage.browser['session'] = logins.create(email)
+    return RedirectResponse('/')
+
+
+@ui.page('/logout')
+def logout_page():
+    session_id = app.storage.browser.pop('session', None)
+    if session_id:
+        logins.drop(session_id)
+    return RedirectResponse('/login')
+
+
 @ui.page('/')
 def index():
-    if not app.storage.user.get('authed'):
+    if not is_authed():
         ui.navigate.to('/login')
         return
-    global users_table, journals_table
+    # version the widgets below are built from; later changes arrive through on_snapshot
+    rendered = sync.version
     with ui.header().classes('items-center justify-between'):
         ui.label('MentalTrack Admin').classes('text-lg md:text-2xl font-bold')
-        def do_refresh():
-            reload_data()
-            if users_table:
-                users_table.rows = store['users']
-                users_table.update()
-            if journals_table:
-                journals_table.rows = store['journals']
-                journals_table.update()
-            update_overview()
-            update_chart()
-            if not last_fetch_ok:
-                ui.notify('Failed to load data from Firebase', color='negative')
+        with ui.row().classes('items-center gap-2') as loading_row:
+            ui.spinner(size='sm', color='white')
+            ui.label('Loading data...').classes('text-sm')
+        loading_row.set_visibility(not data_ready)
+        age_label = ui.label('').classes('text-xs')
+        def on_snapshot(changes):
+            # `changes` is (uids, journal keys) touched since this page last rendered, None for everything
+            loading_row.set_visibility(False)
+            if changes is None or changes[0]:
+                background_tasks.create(apply_user_search())
+            if changes is None or changes[1]:
+                background_tasks.create(apply_journal_filters())
+            if changes is None or changes[0] or changes[1]:
+                update_overview()
+                background_tasks.create(update_chart())
+        def watch_snapshot():
+            if data_ready:
+                loading_row.set_visibility(False)
+            if last_good_at is None:
+                age_label.text = 'Last refresh failed' if data_ready else ''
+            elif last_fetch_ok:
+                age_label.text = f'Updated {format_age(time.time() - last_good_at)}'
             else:
-                ui.notify('Data refreshed', color='positive')
-        ui.button('Refresh', on_click=do_refresh).props('unelevated color=primary')
-        def do_logout():
+                age_label.text = f'Refresh failed, showing data from {format_age(time.time() - last_good_at)}'
+            age_label.classes(replace='text-xs' if last_fetch_ok else 'text-xs text-red-200')
+        async def do_refresh():
+            refresh_btn.props('loading')
             try:
-                app.storage.user.clear()
-            except Exception:
-                pass
-            ui.navigate.to('/login')
-        ui.button('Logout', on_click=do_logout).props('flat color=negative')
+                ok = await refresh_data()
+            finally:
+                refresh_btn.props(remove='loading')
+            watch_snapshot()
+            if not ok:
+                ui.notify('Failed to load data from Firebase, showing the last good snapshot', color='negative')
+            else:
+                ui.notify('Data refreshed', color='positive')
+        refresh_btn = ui.button('Refresh', on_click=do_refresh).props('unelevated color=primary')
+        ui.button('Logout', on_click=lambda: ui.navigate.to('/logout')).props('flat color=negative')
 
     with ui.row().classes('w-full'):
         tabs = ui.tabs().classes('w-full')
@@ -191,7 +538,8 @@ def index():
             ui.tab('Users')
             ui.tab('Journals')
             ui.tab('Analytics')
-        with ui.tab_panels(tabs, value='Overview').classes('w-full'):
+            ui.tab('Diagnostics')
+        with ui.tab_panels(tabs, value='Overview').classes('w-full') as panels:
             with ui.tab_panel('Overview').classes('w-full'):
                 with ui.row().classes('w-full gap-4 flex-wrap'):
                     overview_users = ui.card().classes('w-full md:w-1/3')
@@ -210,9 +558,7 @@ def index():
                 def update_overview():
                     total_users_label.text = str(len(store['users']))
                     total_journals_label.text = str(len(store['journals']))
-                    moods = [j['mood'] for j in store['journals'] if isinstance(j.get('mood'), (int, float))]
-                    avg = round(sum(moods) / len(moods), 2) if moods else 0
-                    avg_mood_label.text = str(avg)
+                    avg_mood_label.text = str(analytics.summary()['average'])
 
                 update_overview()
 
@@ -220,66 +566,81 @@ def index():
                 with ui.column().classes('w-full gap-4'):
                     with ui.row().classes('items-end gap-2'):
                         user_search = ui.input(label='Search users').classes('w-full md:w-1/3')
-                        def apply_user_search():
-                            term = (user_search.value or '').lower()
-                            filtered = [u for u in store['users'] if term in u['username'].lower() or term in u['email'].lower() or term in u['uid'].lower()]
-                            users_table.rows = filtered
-                            users_table.update()
-                        user_search.on('change', apply_user_search)
-                        def export_users():
-                            download_csv(users_table.rows, users_columns, 'users.csv')
-                        ui.button('Export CSV', on_click=export_users).props('unelevated')
-                    users_columns = [
-                        {'name': 'uid', 'label': 'UID', 'field': 'uid', 'sortable': True},
-                        {'name': 'username', 'label': 'Username', 'field': 'username', 'sortable': True},
-                        {'name': 'email', 'label': 'Email', 'field': 'email', 'sortable': True},
-                        {'name': 'journals', 'label': 'Journals', 'field': 'journals', 'sortable': True},
-                    ]
-                    selected_user_row = {'value': None}
+                        users_view = {'matches': None, 'version': None, 'selected': None, 'request': 0, 'pagination': {'sortBy': None, 'descending': False, 'page': 1, 'rowsPerPage': PAGE_SIZE}}
+                        async def show_users_page():
+                            p = users_view['pagination']
+                            request = users_view['request'] = users_view['request'] + 1
+                            result = await run.io_bound(users_page, users_view, user_search.value)
+                            # a later request may have overtaken this one while it waited
+                            if result is None or request != users_view['request']:
+                                return
+                            rows, total, page = result
+                            show_rows(users_table, rows, {**p, 'page': page, 'rowsNumber': total}, 'users')
+                        async def apply_user_search():
+                            users_view['version'] = None
+                            await show_users_page()
+                        async def on_user_search():
+                            users_view['pagination']['page'] = 1
+                            await apply_user_search()
+                        user_search.on('change', on_user_search)
+                        def export_users(fmt, gzip):
+                            p = users_view['pagination']
+                            ui.download.from_url(export_url('users', fmt, gzip, q=user_search.value, sort=p.get('sortBy'), desc=int(bool(p.get('descending')))))
+                        export_menu(export_users)
                     def on_users_select(e):
+                        # kept as a key and resolved on use, so it survives refreshes
                         sel = e.selection or []
-                        if sel:
-                            s = sel[0]
-                            if isinstance(s, dict):
-                                selected_user_row['value'] = s
-                            else:
-                                try:
-                                    selected_user_row['value'] = next((r for r in users_table.rows if r.get('uid') == s), None)
-                                except Exception:
-                                    selected_user_row['value'] = None
-                        else:
-                            selected_user_row['value'] = None
-                    users_table = ui.table(columns=users_columns, rows=store['users'], row_key='uid', selection='single', on_select=on_users_select).classes('w-full')
+                        users_view['selected'] = (sel[0].get('uid') if isinstance(sel[0], dict) else sel[0]) if sel else None
+                    async def on_users_request(e):
+                        # a sortBy the table does not offer is dropped, as /export answers it with a 400
+                        if e.args['pagination'].get('sortBy') not in SORTABLE['users'] | {None, ''}:
+                            return
+                        users_view['pagination'] = e.args['pagination']
+                        await show_users_page()
+                    users_table = ui.table(columns=users_columns, rows=[], row_key='uid', selection='single', on_select=on_users_select, pagination=users_view['pagination']).classes('w-full')
+                    users_table.props(f':rows-per-page-options="{PAGE_SIZE_OPTIONS}"')
+                    users_table.on('request', on_users_request, ['pagination'])
+                    background_tasks.create(show_users_page())
                     with ui.dialog() as user_dialog, ui.card().classes('w-full md:w-[32rem]'):
                         user_title = ui.label('User Profile').classes('text-lg font-semibold')
                         user_avatar = ui.avatar('').props('size=64')
                         user_email = ui.label('')
                         user_uid = ui.label('')
                         ui.separator()
-                        ui.label('Recent Journals').classes('text-sm text-gray-600')
+                        user_journal_count = ui.label('Recent Journals').classes('text-sm text-gray-600')
                         user_journal_list = ui.column().classes('gap-2')
-                        def open_user(selected):
+                        profile = {'uid': None, 'shown': 0}
+                        async def show_more_journals():
+                            uid = profile['uid']
+                            journals = await run.io_bound(sync.recent_journals, uid, profile['shown'], PROFILE_PAGE) or []
+                            profile['shown'] += len(journals)
+                            with user_journal_list:
+                                for j in journals:
+                                    ui.label(f"{j.get('date','')} • Mood {j.get('mood','')} • {(j.get('summary') or '')[:60]}")
+                            total = sync.user_journals.count(uid)
+                            user_journal_count.text = f"Recent Journals ({profile['shown']} of {total})"
+                            more_button.set_visibility(profile['shown'] < total)
+                        more_button = ui.button('Load more', on_click=show_more_journals).props('flat dense')
+                        async def open_user(selected):
                             user_title.text = selected.get('username') or 'User Profile'
                             user_email.text = selected.get('email') or ''
                             user_uid.text = selected.get('uid') or ''
                             photo = selected.get('photo') or ''
                             if is_http(photo):
-                                user_avatar.props(f'src={photo}')
+                                user_avatar.props(f"src={image_url('user', selected['uid'], 128)}")
                             else:
                                 user_avatar.props('icon=person')
                             user_journal_list.clear()
-                            uid = selected.get('uid')
-                            journals = [j for j in store['journals'] if j.get('uid') == uid]
-                            for j in sorted(journals, key=lambda x: x.get('date') or '', reverse=True)[:8]:
-                                with user_journal_list:
-                                    ui.label(f"{j.get('date','')} • Mood {j.get('mood','')} • {j.get('summary','')[:60]}")
+                            profile['uid'] = selected.get('uid')
+                            profile['shown'] = 0
+                            await show_more_journals()
                             user_dialog.open()
-                    def on_user_view():
-                        selected = selected_user_row['value']
+                    async def on_user_view():
+                        selected = await run.io_bound(user_by_uid, users_view['selected'])
                         if not selected:
                             ui.notify('No user selected', color='warning')
                             return
-                        open_user(selected)
+                        await open_user(selected)
                     ui.button('View Selected', on_click=on_user_view).props('unelevated')
 
             with ui.tab_panel('Journals').classes('w-full'):
@@ -290,33 +651,34 @@ def index():
                     with ui.row().classes('items-end gap-2 flex-wrap'):
                         start_date = ui.input(label='Start date', placeholder='YYYY-MM-DD').props('outlined dense').classes('w-full md:w-1/4')
                         end_date = ui.input(label='End date', placeholder='YYYY-MM-DD').props('outlined dense').classes('w-full md:w-1/4')
-                        def apply_journal_filters():
-                            term = (journal_search.value or '').lower()
-                            sd = parse_date(start_date.value or '')
-                            ed = parse_date(end_date.value or '')
-                            def within_date(d):
-                                dt = parse_date(d or '')
-                                if not dt:
-                                    return False if (sd or ed) else True
-                                if sd and dt < sd:
-                                    return False
-                                if ed and dt > ed:
-                                    return False
-                                return True
-                            filtered = [j for j in store['journals'] if within_date(j.get('date')) and (term in (j.get('summary') or '').lower() or term in (j.get('username') or '').lower() or term in (j.get('email') or '').lower())]
-                            journals_table.rows = filtered
-                            journals_table.update()
-                            count_label.text = f"Showing {len(filtered)} of {len(store['journals'])}"
-                        journal_search.on('change', apply_journal_filters)
-                        start_date.on('change', apply_journal_filters)
-                        end_date.on('change', apply_journal_filters)
-                        def last_n_days(n):
+                        journals_view = {'matches': None, 'version': None, 'selected': None, 'request': 0, 'pagination': {'sortBy': 'date', 'descending': True, 'page': 1, 'rowsPerPage': PAGE_SIZE}}
+                        async def show_journals_page():
+                            p = journals_view['pagination']
+                            request = journals_view['request'] = journals_view['request'] + 1
+                            result = await run.io_bound(journals_page, journals_view, journal_search.value,
+                                                        parse_date(start_date.value or ''), parse_date(end_date.value or ''))
+                            if result is None or request != journals_view['request']:
+                                return
+                            rows, total, page, everything = result
+                            show_rows(journals_table, rows, {**p, 'page': page, 'rowsNumber': total}, 'journals')
+                            first = (page - 1) * (p.get('rowsPerPage') or 0) + 1 if rows else 0
+                            count_label.text = f"Showing {first}-{first + len(rows) - 1 if rows else 0} of {total} matching ({everything} total)"
+                        async def apply_journal_filters():
+                            journals_view['version'] = None
+                            await show_journals_page()
+                        async def on_journal_filter():
+                            journals_view['pagination']['page'] = 1
+                            await apply_journal_filters()
+                        journal_search.on('change', on_journal_filter)
+                        start_date.on('change', on_journal_filter)
+                        end_date.on('change', on_journal_filter)
+                        async def last_n_days(n):
                             today = datetime.date.today()
                             start = today - datetime.timedelta(days=n-1)
                             start_date.value = start.strftime('%Y-%m-%d')
                             end_date.value = today.strftime('%Y-%m-%d')
-                            apply_journal_filters()
-                        def this_month():
+                            await on_journal_filter()
+                        async def this_month():
                             today = datetime.date.today()
                             start = today.replace(day=1)
                             if start.month == 12:
@@ -326,43 +688,41 @@ def index():
                             last_day = next_month - datetime.timedelta(days=1)
                             start_date.value = start.strftime('%Y-%m-%d')
                             end_date.value = last_day.strftime('%Y-%m-%d')
-                            apply_journal_filters()
-                        def clear_dates():
+                            await on_journal_filter()
+                        async def clear_dates():
                             start_date.value = None
                             end_date.value = None
-                            apply_journal_filters()
+                            await on_journal_filter()
                         ui.button('Last 7 days', on_click=lambda: last_n_days(7)).props('unelevated')
                         ui.button('Last 30 days', on_click=lambda: last_n_days(30)).props('unelevated')
                         ui.button('This month', on_click=this_month).props('unelevated')
                         ui.button('Clear', on_click=clear_dates).props('unelevated')
 
-                    journals_columns = [
-                        {'name': 'date', 'label': 'Date', 'field': 'date', 'sortable': True},
-                        {'name': 'username', 'label': 'Username', 'field': 'username', 'sortable': True},
-                        {'name': 'email', 'label': 'Email', 'field': 'email', 'sortable': True},
-                        {'name': 'mood', 'label': 'Mood', 'field': 'mood', 'sortable': True},
-                        {'name': 'summary', 'label': 'Summary', 'field': 'summary', 'sortable': False},
-                        {'name': 'image', 'label': 'ImagePath', 'field': 'image', 'sortable': False},
-                    ]
-                    selected_journal_row = {'value': None}
                     def on_journals_select(e):
                         sel = e.selection or []
-                        if sel:
-                            s = sel[0]
-                            if isinstance(s, dict):
-                                selected_journal_row['value'] = s
-                            else:
-                                try:
-                                    selected_journal_row['value'] = next((r for r in journals_table.rows if r.get('push_id') == s), None)
-                                except Exception:
-                                    selected_journal_row['value'] = None
-                        else:
-                            selected_journal_row['value'] = None
-                    journals_table = ui.table(columns=journals_columns, rows=store['journals'], row_key='push_id', selection='single', on_select=on_journals_select).classes('w-full')
+                        journals_view['selected'] = (sel[0].get('push_id') if isinstance(sel[0], dict) else sel[0]) if sel else None
+                    async def on_journals_request(e):
+                        if e.args['pagination'].get('sortBy') not in SORTABLE['journals'] | {None, ''}:
+                            return
+                        journals_view['pagination'] = e.args['pagination']
+                        await show_journals_page()
+                    journals_table = ui.table(columns=[thumb_column] + journals_columns, rows=[], row_key='push_id', selection='single', on_select=on_journals_select, pagination=journals_view['pagination']).classes('w-full')
+                    journals_table.props(f':rows-per-page-options="{PAGE_SIZE_OPTIONS}"')
+                    journals_table.on('request', on_journals_request, ['pagination'])
+                    journals_table.add_slot('body-cell-thumb', '''
+                        <q-td :props="props">
+                            <img v-if="/^https?:\\/\\//.test(props.value || '')" loading="lazy"
+                                 :src="'/images/journal/' + encodeURIComponent(props.row.push_id) + '?size=64'"
+                                 style="width: 40px; height: 40px; object-fit: cover; border-radius: 4px" />
+                        </q-td>
+                    ''')
                     count_label = ui.label('').classes('text-xs text-gray-600')
-                    def export_journals():
-                        download_csv(journals_table.rows, journals_columns, 'journals.csv')
-                    ui.button('Export CSV', on_click=export_journals).props('unelevated')
+                    background_tasks.create(show_journals_page())
+                    def export_journals(fmt, gzip):
+                        p = journals_view['pagination']
+                        ui.download.from_url(export_url('journals', fmt, gzip, q=journal_search.value, start=start_date.value, end=end_date.value,
+                                                        sort=p.get('sortBy'), desc=int(bool(p.get('descending')))))
+                    export_menu(export_journals)
                     with ui.dialog() as journal_dialog, ui.card().classes('w-full md:w-[36rem]'):
                         jd_title = ui.label('Journal Entry').classes('text-lg font-semibold')
                         jd_date = ui.label('')
@@ -378,12 +738,12 @@ def index():
                             jd_summary.text = row.get('summary') or ''
                             img = row.get('image') or ''
                             if is_http(img):
-                                jd_image.props(f'src={img}')
+                                jd_image.props(f"src={image_url('journal', row['push_id'], 800)}")
                             else:
                                 jd_image.props('src=')
                             journal_dialog.open()
-                    def on_journal_view():
-                        selected = selected_journal_row['value']
+                    async def on_journal_view():
+                        selected = await run.io_bound(sync.journal, journals_view['selected'])
                         if not selected:
                             ui.notify('Select a journal row first', color='warning')
                             return
@@ -392,29 +752,143 @@ def index():
 
             with ui.tab_panel('Analytics').classes('w-full'):
                 with ui.column().classes('w-full gap-4'):
+                    with ui.row().classes('items-end gap-2 flex-wrap'):
+                        chart_start = ui.input(label='Start date', placeholder='YYYY-MM-DD').props('outlined dense').classes('w-full md:w-1/5')
+                        chart_end = ui.input(label='End date', placeholder='YYYY-MM-DD').props('outlined dense').classes('w-full md:w-1/5')
+                        chart_user = ui.select({}, label='User', with_input=True, clearable=True).props('outlined dense').classes('w-full md:w-1/4')
+                        chart_period = ui.toggle({'day': 'Daily', 'week': 'Weekly'}, value='week')
                     chart = ui.echart({
+                        'title': {'text': 'Mood distribution', 'textStyle': {'fontSize': 14}},
                         'tooltip': {},
                         'grid': {'left': '3%', 'right': '3%', 'bottom': '3%', 'containLabel': True},
                         'xAxis': {'type': 'category', 'data': ['1', '2', '3', '4', '5']},
                         'yAxis': {'type': 'value'},
                         'series': [{'name': 'Mood Count', 'type': 'bar', 'data': [0, 0, 0, 0, 0], 'itemStyle': {'color': '#3b82f6'}}],
                     }).classes('w-full h-64')
-
-                    def update_chart():
-                        counts = [0, 0, 0, 0, 0]
-                        for j in store['journals']:
-                            m = j.get('mood')
-                            if isinstance(m, int) and 1 <= m <= 5:
-                                counts[m - 1] += 1
-                        chart.options['series'][0]['data'] = counts
-                        chart.update()
-
-                    update_chart()
+                    trend_chart = ui.echart({
+                        'title': {'text': 'Journaling and mood over time', 'textStyle': {'fontSize': 14}},
+                        'tooltip': {'trigger': 'axis'},
+                        'legend': {'top': 24},
+                        'grid': {'left': '3%', 'right': '3%', 'top': 64, 'bottom': '3%', 'containLabel': True},
+                        'xAxis': {'type': 'category', 'data': []},
+                        'yAxis': [{'type': 'value', 'name': 'Count'}, {'type': 'value', 'name': 'Mood', 'min': 1, 'max': 5}],
+                        'series': [
+                            {'name': 'Entries', 'type': 'bar', 'data': [], 'itemStyle': {'color': '#3b82f6'}},
+                            {'name': 'Active users', 'type': 'line', 'data': [], 'itemStyle': {'color': '#10b981'}},
+                            {'name': 'Average mood', 'type': 'line', 'yAxisIndex': 1, 'data': [], 'itemStyle': {'color': '#f59e0b'}},
+                        ],
+                    }).classes('w-full h-72')
+                    with ui.row().classes('w-full gap-4 flex-wrap md:flex-nowrap'):
+                        users_chart = ui.echart({
+                            'title': {'text': 'Most active users', 'textStyle': {'fontSize': 14}},
+                            'tooltip': {'trigger': 'axis'},
+                            'legend': {'top': 24},
+                            'grid': {'left': '3%', 'right': '3%', 'top': 64, 'bottom': '3%', 'containLabel': True},
+                            'xAxis': [{'type': 'value', 'name': 'Entries'}, {'type': 'value', 'name': 'Mood', 'min': 0, 'max': 5}],
+                            'yAxis': {'type': 'category', 'data': [], 'inverse': True},
+                            'series': [
+                                {'name': 'Entries', 'type': 'bar', 'data': [], 'itemStyle': {'color': '#3b82f6'}},
+                                {'name': 'Average mood', 'type': 'scatter', 'xAxisIndex': 1, 'data': [], 'itemStyle': {'color': '#f59e0b'}},
+                            ],
+                        }).classes('w-full md:w-1/2 h-96')
+                        cohort_chart = ui.echart({
+                            'title': {'text': 'Cohorts by first entry month', 'textStyle': {'fontSize': 14}},
+                            'tooltip': {'trigger': 'axis'},
+                            'legend': {'top': 24},
+                            'grid': {'left': '3%', 'right': '3%', 'top': 64, 'bottom': '3%', 'containLabel': True},
+                            'xAxis': {'type': 'category', 'data': []},
+                            'yAxis': [{'type': 'value', 'name': 'Users'}, {'type': 'value', 'name': 'Mood', 'min': 1, 'max': 5}],
+                            'series': [
+                                {'name': 'Users', 'type': 'bar', 'data': [], 'itemStyle': {'color': '#3b82f6'}},
+                                {'name': 'Entries per user', 'type': 'line', 'data': [], 'itemStyle': {'color': '#10b981'}},
+                                {'name': 'Average mood', 'type': 'line', 'yAxisIndex': 1, 'data': [], 'itemStyle': {'color': '#f59e0b'}},
+                            ],
+                        }).classes('w-full md:w-1/2 h-96')
+
+                    chart_users = {'version': None}
+                    async def update_chart():
+                        if chart_users['version'] != sync.version:
+                            chart_users['version'] = sync.version
+                            options = await run.io_bound(user_options) or {}
+                            chart_user.set_options(options, value=chart_user.value if chart_user.value in sync.user_pos else None)
+                        sd = parse_date(chart_start.value or '')
+                        ed = parse_date(chart_end.value or '')
+                        start = sd.toordinal() if sd else None
+                        end = ed.toordinal() if ed else None
+                        uid = chart_user.value or None
+                        patch_chart(chart, [(chart.options['series'][0], 'data', analytics.distribution(start, end, uid))])
+                        trend = analytics.trend(start, end, uid, chart_period.value)
+                        patch_chart(trend_chart, [(trend_chart.options['xAxis'], 'data', trend['labels'])] +
+                                    [(series, 'data', trend[field]) for series, field in zip(trend_chart.options['series'], ('entries', 'active', 'average'))])
+                        top = analytics.by_user(start, end)
+                        patch_chart(users_chart, [
+                            (users_chart.options['yAxis'], 'data', [t[0] for t in top]),
+                            (users_chart.options['series'][0], 'data', [t[1] for t in top]),
+                            (users_chart.options['series'][1], 'data', [t[2] for t in top]),
+                        ])
+                        cohorts = analytics.cohorts()
+                        patch_chart(cohort_chart, [(cohort_chart.options['xAxis'], 'data', cohorts['labels'])] +
+                                    [(series, 'data', cohorts[field]) for series, field in zip(cohort_chart.options['series'], ('users', 'per_user', 'average'))])
+                    chart_start.on('change', update_chart)
+                    chart_end.on('change', update_chart)
+                    chart_user.on_value_change(update_chart)
+                    chart_period.on_value_change(update_chart)
+
+                    background_tasks.create(update_chart())
+
+            with ui.tab_panel('Diagnostics').classes('w-full'):
+                with ui.column().classes('w-full gap-4'):
+                    metrics_columns = [
+                        {'name': 'name', 'label': 'Metric', 'field': 'name', 'align': 'left'},
+                        {'name': 'labels', 'label': 'Labels', 'field': 'labels', 'align': 'left'},
+                        {'name': 'count', 'label': 'Count', 'field': 'count'},
+                        {'name': 'value', 'label': 'Value / avg', 'field': 'value'},
+                        {'name': 'p50', 'label': 'p50 <=', 'field': 'p50'},
+                        {'name': 'p95', 'label': 'p95 <=', 'field': 'p95'},
+                    ]
+                    metrics_table = ui.table(columns=metrics_columns, rows=[], row_key='id', pagination=0).props('dense flat').classes('w-full')
+                    async def show_metrics():
+                        # gauges read the snapshot under sync.lock
+                        summary = await run.io_bound(metrics.summary)
+                        if summary is None:
+                            return
+                        rows = []
+                        for i, m in enumerate(summary):
+                            rows.append({
+                                'id': i,
+                                'name': m['name'],
+                                'labels': ', '.join(f'{k}={v}' for k, v in m['labels'].items()),
+                                'count': f"{m['count']:g}" if 'count' in m else '',
+                                'value': f"{m['avg'] if 'avg' in m else m['value']:.4g}",
+                                'p50': f"{m['p50']:g}" if 'p50' in m else '',
+                                'p95': f"{m['p95']:g}" if 'p95' in m else '',
+                            })
+                        metrics_table.rows = rows
+                    with ui.row().classes('items-center gap-2'):
+                        ui.button('Refresh metrics', on_click=show_metrics).props('unelevated')
+                        profile_mode = ui.toggle({'sample': 'Sampling (all threads)', 'cprofile': 'cProfile (event loop)'}, value='sample')
+                        def toggle_profiler():
+                            if profiler.running:
+                                profile_output.content = profiler.stop()
+                                profile_button.text = 'Start profiling'
+                            else:
+                                profiler.start(profile_mode.value)
+                                profile_button.text = 'Stop profiling'
+                        profile_button = ui.button('Stop profiling' if profiler.running else 'Start profiling', on_click=toggle_profiler).props('unelevated color=primary')
+                    profile_output = ui.code('', language='text').classes('w-full')
+                    # only refresh while the tab is open
+                    ui.timer(5, lambda: show_metrics() if panels.value == 'Diagnostics' else None)
+
+    client = ui.context.client
+    sessions.subscribe(client.id, on_snapshot, rendered, lambda: client.id in Client.instances)
+    client.on_delete(lambda: sessions.unsubscribe(client.id))
+    watch_snapshot()
+    ui.timer(2, watch_snapshot)
 
 # main.py
 if __name__ in {"__main__", "__mp_main__"}:
     ui.run(
         host='0.0.0.0', # Critical for Cloud Run deployment
         port=int(os.environ.get('PORT', 8080)),
-        storage_secret=os.getenv('STORAGE_SECRET', 'mentaltrack_secret_key')
+        storage_secret=STORAGE_SECRET
     )
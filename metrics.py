@@ -0,0 +1,273 @@
+import bisect
+import collections
+import cProfile
+import io
+import pstats
+import sys
+import threading
+import time
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+COUNT_BUCKETS = (0, 1, 10, 25, 50, 100, 500, 1000, 10000, 100000)
+
+_lock = threading.Lock()
+_metrics = {}
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    if value != value:
+        return 'NaN'
+    if value in (float('inf'), float('-inf')):
+        return '+Inf' if value > 0 else '-Inf'
+    return f'{value:g}'
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.values = collections.defaultdict(float)
+
+    def inc(self, value=1, **labels):
+        with _lock:
+            self.values[_label_key(labels)] += value
+
+    def samples(self):
+        with _lock:
+            return [(self.name, key, (), value) for key, value in self.values.items()]
+
+    def summary(self):
+        with _lock:
+            return [{'name': self.name, 'labels': dict(key), 'count': value} for key, value in self.values.items()]
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.series = {}
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with _lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [[0] * (len(self.buckets) + 1), 0, 0.0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += 1
+            series[2] += value
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def samples(self):
+        out = []
+        with _lock:
+            for key, (counts, count, total) in self.series.items():
+                running = 0
+                for bound, n in zip(self.buckets + ('+Inf',), counts):
+                    running += n
+                    out.append((self.name + '_bucket', key, (('le', bound),), running))
+                out.append((self.name + '_count', key, (), count))
+                out.append((self.name + '_sum', key, (), total))
+        return out
+
+    def quantile(self, counts, count, q):
+        # upper bound of the bucket holding the q-th observation
+        target = q * count
+        running = 0
+        for bound, n in zip(self.buckets + (float('inf'),), counts):
+            running += n
+            if running >= target:
+                return bound
+        return float('inf')
+
+    def summary(self):
+        with _lock:
+            series = [(key, list(counts), count, total) for key, (counts, count, total) in self.series.items()]
+        return [{
+            'name': self.name,
+            'labels': dict(key),
+            'count': count,
+            'sum': total,
+            'avg': total / count if count else 0,
+            'p50': self.quantile(counts, count, 0.5),
+            'p95': self.quantile(counts, count, 0.95),
+        } for key, counts, count, total in series]
+
+
+class Gauge:
+    kind = 'gauge'
+
+    def __init__(self, name, help, read):
+        # `read` returns a number, or a {labels tuple: number} dict, at scrape time
+        self.name = name
+        self.help = help
+        self.read = read
+
+    def _values(self):
+        try:
+            value = self.read()
+        except Exception:
+            return {}
+        return value if isinstance(value, dict) else {(): value}
+
+    def samples(self):
+        return [(self.name, key, (), value) for key, value in self._values().items()]
+
+    def summary(self):
+        return [{'name': self.name, 'labels': dict(key), 'value': value} for key, value in self._values().items()]
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+def _register(metric):
+    with _lock:
+        return _metrics.setdefault(metric.name, metric)
+
+
+def counter(name, help):
+    return _register(Counter(name, help))
+
+
+def histogram(name, help, buckets=LATENCY_BUCKETS):
+    return _register(Histogram(name, help, buckets))
+
+
+def gauge(name, help, read):
+    # re-registering replaces the callback, so a reloaded module does not keep a stale one
+    metric = Gauge(name, help, read)
+    with _lock:
+        _metrics[name] = metric
+    return metric
+
+
+def render():
+    # Prometheus text exposition format
+    lines = []
+    with _lock:
+        metrics = sorted(_metrics.values(), key=lambda m: m.name)
+    for metric in metrics:
+        lines.append(f'# HELP {metric.name} {metric.help}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        for name, key, extra, value in metric.samples():
+            lines.append(f'{name}{_format_labels(key, extra)} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def summary():
+    # flat rows for the diagnostics panel
+    with _lock:
+        metrics = sorted(_metrics.values(), key=lambda m: m.name)
+    rows = []
+    for metric in metrics:
+        rows.extend(metric.summary())
+    return rows
+
+
+class Profiler:
+    # Live capture for the diagnostics panel. 'sample' mode walks every thread's stack
+    # from a daemon thread, so it also sees the sync and export threads; 'cprofile'
+    # mode is deterministic but only covers the event loop thread it is started from.
+
+    def __init__(self):
+        self.mode = None
+        self.started = None
+        self._profile = None
+        self._samples = collections.Counter()
+        self._leaf = collections.Counter()
+        self._count = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self.mode is not None
+
+    def start(self, mode='sample', interval=0.005):
+        if self.running:
+            return
+        self.mode = mode
+        self.started = time.time()
+        if mode == 'cprofile':
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+            return
+        self._samples.clear()
+        self._leaf.clear()
+        self._count = 0
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample, args=(interval,), name='profiler', daemon=True)
+        self._thread.start()
+
+    def _sample(self, interval):
+        me = threading.get_ident()
+        while not self._stop.wait(interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                seen = set()
+                leaf = True
+                while frame is not None:
+                    code = frame.f_code
+                    where = f'{code.co_name} ({code.co_filename.rsplit("/", 1)[-1]}:{code.co_firstlineno})'
+                    if leaf:
+                        self._leaf[where] += 1
+                        leaf = False
+                    if where not in seen:
+                        seen.add(where)
+                        self._samples[where] += 1
+                    frame = frame.f_back
+                self._count += 1
+
+    def stop(self, limit=40):
+        # stops the capture and returns a text report
+        if not self.running:
+            return ''
+        mode, self.mode = self.mode, None
+        elapsed = time.time() - self.started
+        if mode == 'cprofile':
+            self._profile.disable()
+            out = io.StringIO()
+            pstats.Stats(self._profile, stream=out).sort_stats('cumulative').print_stats(limit)
+            self._profile = None
+            return out.getvalue()
+        self._stop.set()
+        self._thread.join()
+        total = max(self._count, 1)
+        lines = [f'{self._count} thread samples over {elapsed:.1f}s', '', 'self%   total%  function']
+        for where, n in self._leaf.most_common(limit):
+            lines.append(f'{100 * n / total:5.1f}  {100 * self._samples[where] / total:6.1f}  {where}')
+        return '\n'.join(lines)
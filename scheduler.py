@@ -0,0 +1,32 @@
+import asyncio
+import os
+import random
+
+
+class RefreshScheduler:
+    # Calls `refresh` (an async callable returning True on success) forever: every
+    # `interval` seconds while it succeeds, backing off exponentially up to
+    # `max_backoff` while it fails. `jitter` spreads each delay by +/- that fraction.
+    # An interval of 0 runs a single refresh and stops.
+
+    def __init__(self, refresh, interval=None, jitter=None, max_backoff=None):
+        self.refresh = refresh
+        self.interval = interval if interval is not None else float(os.getenv('REFRESH_INTERVAL', 30))
+        self.jitter = jitter if jitter is not None else float(os.getenv('REFRESH_JITTER', 0.1))
+        self.max_backoff = max_backoff if max_backoff is not None else float(os.getenv('REFRESH_MAX_BACKOFF', 600))
+        self.failures = 0
+
+    def next_delay(self):
+        delay = min(self.interval * (2 ** min(self.failures, 16)), max(self.interval, self.max_backoff))
+        return max(0.0, delay * (1 + random.uniform(-self.jitter, self.jitter)))
+
+    async def run(self):
+        while True:
+            try:
+                ok = await self.refresh()
+            except Exception:
+                ok = False
+            self.failures = 0 if ok else self.failures + 1
+            if self.interval <= 0:
+                return
+            await asyncio.sleep(self.next_delay())
@@ -0,0 +1,51 @@
+import logging
+import time
+
+import metrics
+
+log = logging.getLogger(__name__)
+
+PUBLISH_SECONDS = metrics.histogram('publish_seconds', 'Pushing one snapshot version to every open page')
+
+
+class Sessions:
+    # Connected dashboard pages. The snapshot is held once per process; each page keeps
+    # only its own view state (filters, page, selection) and subscribes a callback here.
+    # publish() hands every page the keys changed since the version it last rendered,
+    # so a page whose rows were not touched sends nothing to its browser.
+
+    def __init__(self, sync):
+        self.sync = sync
+        self.pages = {}
+
+    def __len__(self):
+        return len(self.pages)
+
+    def subscribe(self, client_id, callback, version, alive=None):
+        # `alive` tells whether the page is still connected; closed pages are dropped on publish
+        self.pages[client_id] = [callback, version, alive]
+
+    def unsubscribe(self, client_id):
+        self.pages.pop(client_id, None)
+
+    def publish(self):
+        version = self.sync.version
+        start = time.perf_counter()
+        pushed = False
+        for client_id, (callback, since, alive) in list(self.pages.items()):
+            if alive and not alive():
+                self.unsubscribe(client_id)
+                continue
+            if since == version:
+                continue
+            changes = self.sync.changes_since(since)
+            self.pages[client_id][1] = version
+            pushed = True
+            try:
+                callback(changes)
+            except Exception:
+                log.exception('updating page %s to snapshot version %s failed', client_id, version)
+                if alive and not alive():
+                    self.unsubscribe(client_id)
+        if pushed:
+            PUBLISH_SECONDS.observe(time.perf_counter() - start)
@@ -0,0 +1,211 @@
+import os
+import sqlite3
+import time
+import uuid
+
+SCHEMA_VERSION = 2
+
+USER_FIELDS = ('uid', 'username', 'email', 'photo', 'journals')
+JOURNAL_FIELDS = ('uid', 'push_id', 'username', 'email', 'mood', 'summary', 'date', 'image')
+
+
+class SnapshotCache:
+    # On-disk copy of the transformed store plus a hash of each user's raw tree, so a
+    # cold start can serve the last snapshot in milliseconds and the sync engine only
+    # rebuilds the users whose hash changed once the live snapshot arrives.
+    #
+    # The same file doubles as the shared snapshot for several workers on one host:
+    # every save bumps a generation stamped on the users it rewrote (removed users
+    # leave a tombstone), so followers read only what changed since their cursor, and
+    # a lease row decides which worker talks to Firebase. WAL mode needs shared memory
+    # and working locks, so the file must not sit on a network filesystem; across
+    # hosts another backend (Redis, a database) can stand in by providing
+    # load/load_since/save/touch/acquire/release.
+
+    def __init__(self, path):
+        self.path = path
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _create(self, conn):
+        # statement by statement, since executescript would commit the caller's transaction
+        for statement in (
+            'DROP TABLE IF EXISTS meta',
+            'DROP TABLE IF EXISTS users',
+            'DROP TABLE IF EXISTS journals',
+            'DROP TABLE IF EXISTS removed',
+            'DROP TABLE IF EXISTS lease',
+            'CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)',
+            'CREATE TABLE users (uid TEXT PRIMARY KEY, hash TEXT, username TEXT, email TEXT, photo TEXT, journals INTEGER, gen INTEGER)',
+            'CREATE INDEX users_gen ON users (gen)',
+            'CREATE TABLE journals (uid TEXT, push_id TEXT, username TEXT, email TEXT, mood, summary TEXT, date TEXT, image TEXT, '
+            'PRIMARY KEY (uid, push_id))',
+            'CREATE TABLE removed (uid TEXT PRIMARY KEY, gen INTEGER)',
+            'CREATE TABLE lease (name TEXT PRIMARY KEY, holder TEXT, expires REAL)',
+        ):
+            conn.execute(statement)
+        conn.executemany('INSERT INTO meta VALUES (?, ?)', [('schema', str(SCHEMA_VERSION)), ('epoch', uuid.uuid4().hex), ('generation', '0')])
+
+    def _ensure(self, conn):
+        if self._meta(conn).get('schema') != str(SCHEMA_VERSION):
+            with conn:
+                conn.execute('BEGIN IMMEDIATE')
+                # another worker may have created it while this one waited for the lock
+                if self._meta(conn).get('schema') != str(SCHEMA_VERSION):
+                    self._create(conn)
+
+    def _meta(self, conn):
+        try:
+            return dict(conn.execute('SELECT key, value FROM meta'))
+        except sqlite3.Error:
+            return {}
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return None
+        try:
+            conn = self._connect()
+        except sqlite3.Error:
+            return None
+        try:
+            meta = self._meta(conn)
+            if meta.get('schema') != str(SCHEMA_VERSION) or 'saved_at' not in meta:
+                return None
+            hashes = {}
+            users = []
+            for uid, digest, *rest in conn.execute(f'SELECT uid, hash, {", ".join(USER_FIELDS[1:])} FROM users'):
+                hashes[uid] = digest
+                users.append(dict(zip(USER_FIELDS, (uid, *rest))))
+            # literal dicts build in about half the time dict(zip(...)) takes
+            journals = [{'uid': uid, 'push_id': push_id, 'username': username, 'email': email, 'mood': mood, 'summary': summary, 'date': date, 'image': image}
+                        for uid, push_id, username, email, mood, summary, date, image in conn.execute(f'SELECT {", ".join(JOURNAL_FIELDS)} FROM journals')]
+            return {
+                'full': True,
+                'hashes': hashes,
+                'users': users,
+                'journals': journals,
+                'removed': [],
+                'saved_at': float(meta['saved_at']),
+                'checked_at': max(float(meta['saved_at']), float(meta.get('checked_at') or 0)),
+                'etag': meta.get('etag'),
+                'cursor': (meta['epoch'], int(meta['generation'])),
+            }
+        except sqlite3.Error:
+            return None
+        finally:
+            conn.close()
+
+    def load_since(self, cursor):
+        # only the users saved after `cursor`, or everything when the cursor is from another file
+        if not os.path.exists(self.path):
+            return None
+        try:
+            conn = self._connect()
+        except sqlite3.Error:
+            return None
+        try:
+            meta = self._meta(conn)
+            if meta.get('schema') != str(SCHEMA_VERSION) or 'saved_at' not in meta:
+                return None
+            if cursor is None or cursor[0] != meta['epoch'] or cursor[1] > int(meta['generation']):
+                conn.close()
+                return self.load()
+            since = cursor[1]
+            hashes = {}
+            users = []
+            for uid, digest, *rest in conn.execute(f'SELECT uid, hash, {", ".join(USER_FIELDS[1:])} FROM users WHERE gen > ?', (since,)):
+                hashes[uid] = digest
+                users.append(dict(zip(USER_FIELDS, (uid, *rest))))
+            columns = ', '.join(f'j.{f}' for f in JOURNAL_FIELDS)
+            journals = [dict(zip(JOURNAL_FIELDS, values)) for values in conn.execute(
+                f'SELECT {columns} FROM journals j JOIN users u ON u.uid = j.uid WHERE u.gen > ?', (since,))]
+            removed = [uid for (uid,) in conn.execute('SELECT uid FROM removed WHERE gen > ?', (since,))]
+            return {
+                'full': False,
+                'hashes': hashes,
+                'users': users,
+                'journals': journals,
+                'removed': removed,
+                'saved_at': float(meta['saved_at']),
+                'checked_at': max(float(meta['saved_at']), float(meta.get('checked_at') or 0)),
+                'etag': meta.get('etag'),
+                'cursor': (meta['epoch'], int(meta['generation'])),
+            }
+        except sqlite3.Error:
+            return None
+        finally:
+            conn.close()
+
+    def save(self, hashes, users, journals, uids, etag=None):
+        # rewrites only the given users; `users`/`journals` are the rows for them and `hashes`
+        # their raw trees' content hashes. Returns the new cursor.
+        conn = self._connect()
+        try:
+            self._ensure(conn)
+            with conn:
+                conn.execute('BEGIN IMMEDIATE')
+                meta = self._meta(conn)
+                gen = int(meta['generation']) + 1
+                keys = [(uid,) for uid in uids]
+                conn.executemany('DELETE FROM users WHERE uid = ?', keys)
+                conn.executemany('DELETE FROM journals WHERE uid = ?', keys)
+                kept = {r['uid'] for r in users}
+                conn.executemany('DELETE FROM removed WHERE uid = ?', [(uid,) for uid in kept])
+                conn.executemany('INSERT OR REPLACE INTO removed VALUES (?, ?)', [(uid, gen) for uid in uids if uid not in kept])
+                conn.executemany(
+                    'INSERT INTO users VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    ((r['uid'], hashes.get(r['uid']), r['username'], r['email'], r['photo'], r['journals'], gen) for r in users),
+                )
+                conn.executemany(
+                    'INSERT INTO journals VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    ((r['uid'], r['push_id'], r['username'], r['email'], r['mood'], r['summary'], r['date'], r['image']) for r in journals),
+                )
+                conn.execute("INSERT OR REPLACE INTO meta VALUES ('saved_at', ?)", (str(time.time()),))
+                conn.execute("INSERT OR REPLACE INTO meta VALUES ('generation', ?)", (str(gen),))
+                if etag:
+                    conn.execute("INSERT OR REPLACE INTO meta VALUES ('etag', ?)", (etag,))
+            return meta['epoch'], gen
+        finally:
+            conn.close()
+
+    def touch(self):
+        # the leader checked Firebase and nothing changed; followers show this as the data age
+        conn = self._connect()
+        try:
+            self._ensure(conn)
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO meta VALUES ('checked_at', ?)", (str(time.time()),))
+        finally:
+            conn.close()
+
+    def acquire(self, holder, ttl):
+        # takes or renews the leader lease; True while `holder` owns it
+        conn = self._connect()
+        try:
+            self._ensure(conn)
+            now = time.time()
+            with conn:
+                conn.execute(
+                    "INSERT INTO lease VALUES ('leader', ?, ?) ON CONFLICT (name) DO UPDATE "
+                    'SET holder = excluded.holder, expires = excluded.expires WHERE lease.holder = excluded.holder OR lease.expires < ?',
+                    (holder, now + ttl, now),
+                )
+            row = conn.execute("SELECT holder FROM lease WHERE name = 'leader'").fetchone()
+            return bool(row and row[0] == holder)
+        finally:
+            conn.close()
+
+    def release(self, holder):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("DELETE FROM lease WHERE name = 'leader' AND holder = ?", (holder,))
+        except sqlite3.Error:
+            pass
+        finally:
+            conn.close()
@@ -0,0 +1,90 @@
+import os
+
+PAGE_SIZE = int(os.getenv('TABLE_PAGE_SIZE', 25))
+PAGE_SIZE_OPTIONS = sorted({10, 25, 50, 100, PAGE_SIZE})
+
+
+def is_empty(value):
+    return value is None or value == '' or value != value
+
+
+def sort_key(value):
+    # numbers before strings, so mixed columns still sort; empty values are kept apart by the callers
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return (0, value, '')
+    return (1, 0, str(value).lower())
+
+
+def sorted_positions(positions, values, descending=False):
+    # empty values go last in either direction, in position order. Ties are in position
+    # order ascending and reversed with the rest descending, as TableQuery.select reverses
+    # its cached ascending orders, so both of its paths give the same page.
+    positions = sorted(positions)
+    filled = [i for i in positions if not is_empty(values[i])]
+    empty = [i for i in positions if is_empty(values[i])]
+    filled.sort(key=lambda i: sort_key(values[i]))
+    if descending:
+        filled.reverse()
+    return filled + empty
+
+
+class TableQuery:
+    # Server-side sort/filter/page over one of the store lists. Filters hand in the
+    # positions of matching rows; sorted orders are built once per column and snapshot
+    # version and reused by every page request until the store changes.
+
+    def __init__(self, rows, version):
+        self.rows = rows
+        self.version = version
+        self._orders = {}
+
+    def values(self, rows, field):
+        if hasattr(rows, 'column'):
+            return rows.column(field)
+        return [r.get(field) for r in rows]
+
+    def order(self, sort_by):
+        version = self.version()
+        cached = self._orders.get(sort_by)
+        if cached and cached[0] == version:
+            return cached[1], cached[2]
+        rows = self.rows()
+        if sort_by:
+            values = self.values(rows, sort_by)
+            positions = sorted_positions(range(len(rows)), values)
+            filled = len(positions) - sum(1 for v in values if is_empty(v))
+        else:
+            positions = list(range(len(rows)))
+            filled = len(positions)
+        # (version, ascending positions, how many of them are non-empty)
+        self._orders[sort_by] = (version, positions, filled)
+        return positions, filled
+
+    def select(self, matches=None, sort_by=None, descending=False):
+        # every matching position in display order; `matches` None means all rows
+        rows = self.rows()
+        if matches is not None and len(matches) * 8 < len(rows):
+            # a narrow filter is cheaper to sort directly than to pick out of the full order
+            if sort_by:
+                return sorted_positions(matches, self.values(rows, sort_by), descending)
+            return sorted(matches, reverse=descending)
+        positions, filled = self.order(sort_by)
+        if descending:
+            positions = positions[filled - 1::-1] + positions[filled:] if filled else list(positions)
+        if matches is not None:
+            if not isinstance(matches, (set, frozenset)):
+                matches = set(matches)
+            positions = [i for i in positions if i in matches]
+        return positions
+
+    def page(self, matches=None, sort_by=None, descending=False, page=1, per_page=PAGE_SIZE):
+        positions = self.select(matches, sort_by, descending)
+        total = len(positions)
+        if per_page:
+            pages = max(1, -(-total // per_page))
+            page = min(max(1, page), pages)
+            positions = positions[(page - 1) * per_page:page * per_page]
+        else:
+            page = 1
+        rows = self.rows()
+        return [rows[i] for i in positions if i < len(rows)], total, page
@@ -0,0 +1,51 @@
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_firebase import FakeFirebase
+from benchmarks.synthetic import make_users
+from columnar import JournalColumns
+
+
+@pytest.fixture
+def fake():
+    with FakeFirebase(make_users(200, per_user=5)) as server:
+        yield server
+
+
+@pytest.fixture
+def app_main(tmp_path, monkeypatch):
+    # the app module, signed in; its stores point at tmp_path on the first import in a run
+    for name in ('SNAPSHOT_CACHE', 'SESSION_STORE'):
+        monkeypatch.setenv(name, str(tmp_path / f'{name.lower()}.sqlite3'))
+    monkeypatch.setenv('IMAGE_CACHE', str(tmp_path / 'images'))
+    monkeypatch.setenv('STORAGE_SECRET', 'test-secret-for-the-app-endpoints')
+    # auth reads the secret on import, which another test may have done already
+    import auth
+    monkeypatch.setattr(auth, 'STORAGE_SECRET', 'test-secret-for-the-app-endpoints')
+    import main
+    monkeypatch.setattr(main, 'is_authed', lambda: True)
+    return main
+
+
+def new_store():
+    return {'users': [], 'journals': JournalColumns()}
+
+
+def store_rows(store):
+    # both tables in a stable order, for comparing stores built different ways
+    users = sorted((dict(r) for r in store['users']), key=lambda r: r['uid'])
+    journals = sorted(store['journals'], key=lambda r: (r['uid'], r['push_id']))
+    return users, journals
+
+
+def eventually(check, timeout=10):
+    deadline = time.time() + timeout
+    while not check():
+        if time.time() > deadline:
+            raise AssertionError('condition not met within timeout')
+        time.sleep(0.05)
@@ -0,0 +1,81 @@
+import datetime
+
+from analytics import Analytics
+from columnar import JournalColumns
+
+ENTRIES = [
+    ('u1', 'ann', '2025-01-06', 5),
+    ('u1', 'ann', '2025-01-07', 3),
+    ('u1', 'ann', '2025-01-13', 4),
+    ('u2', 'bob', '2025-01-07', 2),
+    ('u2', 'bob', '2025-02-03', 'great'),
+    ('u2', 'bob', '', 1),
+    ('u3', 'cy', '2025-02-04', 4.5),
+]
+
+
+def day(iso):
+    return datetime.date.fromisoformat(iso).toordinal()
+
+
+def build(entries=ENTRIES):
+    cols = JournalColumns()
+    for i, (uid, name, date, mood) in enumerate(entries):
+        cols.append({'uid': uid, 'push_id': f'-{i}', 'username': name, 'email': f'{name}@example.com', 'mood': mood,
+                     'summary': '', 'date': date, 'image': ''})
+    version = [1]
+    return cols, version, Analytics(cols, lambda: version[0])
+
+
+def test_summary_and_distribution_count_numeric_moods():
+    _, _, a = build()
+    # the non-numeric mood is left out, the undated one only drops out of date ranges
+    assert a.summary() == {'entries': 6, 'average': 3.25}
+    assert a.summary(day('2025-01-07'), day('2025-01-31')) == {'entries': 3, 'average': 3.0}
+    assert a.summary(uid='u2') == {'entries': 2, 'average': 1.5}
+    assert a.summary(uid='nobody') == {'entries': 0, 'average': 0}
+    # 4.5 is not one of the five buckets
+    assert a.distribution() == [1, 1, 1, 1, 1]
+    assert a.distribution(uid='u1') == [0, 0, 1, 1, 1]
+
+
+def test_by_user_ranks_by_entries():
+    _, _, a = build()
+    assert a.by_user() == [('ann', 3, 4.0), ('bob', 2, 1.5), ('cy', 1, 4.5)]
+    assert a.by_user(limit=1) == [('ann', 3, 4.0)]
+    assert a.by_user(day('2025-02-01')) == [('cy', 1, 4.5)]
+
+
+def test_trend_by_day_and_monday_week():
+    _, _, a = build()
+    assert a.trend() == {
+        'labels': ['2025-01-06', '2025-01-07', '2025-01-13', '2025-02-04'],
+        'entries': [1, 2, 1, 1],
+        'average': [5.0, 2.5, 4.0, 4.5],
+        'active': [1, 2, 1, 1],
+    }
+    assert a.trend(period='week') == {
+        'labels': ['2025-01-06', '2025-01-13', '2025-02-03'],
+        'entries': [3, 1, 1],
+        'average': [3.33, 4.0, 4.5],
+        'active': [2, 1, 1],
+    }
+    assert a.trend(uid='u1', period='week')['entries'] == [2, 1]
+
+
+def test_cohorts_group_users_by_first_dated_month():
+    _, _, a = build()
+    assert a.cohorts() == {'labels': ['2025-01', '2025-02'], 'users': [2, 1], 'per_user': [2.0, 1.0], 'average': [3.5, 4.5]}
+
+
+def test_results_are_memoized_per_version():
+    cols, version, a = build()
+    first = a.trend()
+    assert a.trend() is first
+    cols.update(0, {'uid': 'u1', 'push_id': '-0', 'username': 'ann', 'email': 'ann@example.com', 'mood': 1,
+                    'summary': '', 'date': '2025-01-06', 'image': ''})
+    # same version: the frame copied for trend() is reused, so the change is not seen yet
+    assert a.summary() == {'entries': 6, 'average': 3.25}
+    version[0] += 1
+    assert a.summary() == {'entries': 6, 'average': 2.58}
+    assert a.trend()['average'][0] == 1.0
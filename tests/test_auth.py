@@ -0,0 +1,90 @@
+import pytest
+
+import auth
+from auth import SessionStore
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(auth, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def logins(tmp_path):
+    return SessionStore(str(tmp_path / 'sessions.sqlite3'))
+
+
+def test_login_token_is_single_use(logins):
+    token = logins.issue_token('ann@example.com')
+    # another worker on the same file redeems it, after which nobody can
+    assert SessionStore(logins.path).redeem_token(token) == 'ann@example.com'
+    assert logins.redeem_token(token) is None
+    assert logins.redeem_token('made-up') is None
+    assert logins.redeem_token('') is None
+    # each login gets its own token
+    assert logins.issue_token('ann@example.com') != logins.issue_token('ann@example.com')
+
+
+def test_login_token_expires(logins, clock):
+    token = logins.issue_token('ann@example.com')
+    late = logins.issue_token('bob@example.com')
+    clock.now += auth.LOGIN_TOKEN_TTL - 1
+    assert logins.redeem_token(token) == 'ann@example.com'
+    clock.now += 2
+    assert logins.redeem_token(late) is None
+    # an expired token is gone, not just refused
+    clock.now -= 10
+    assert logins.redeem_token(late) is None
+
+
+def test_session_expires(logins, clock):
+    session = logins.create('ann@example.com', ttl=60)
+    assert logins.email(session) == 'ann@example.com'
+    clock.now += 60
+    assert logins.email(session) == 'ann@example.com'
+    clock.now += 1
+    assert logins.email(session) is None
+    # expired rows are swept when the next session is created
+    logins.create('bob@example.com')
+    clock.now -= 30
+    assert logins.email(session) is None
+
+
+def test_logout_drops_the_session_for_every_worker(logins):
+    session = logins.create('ann@example.com')
+    other = logins.create('ann@example.com')
+    worker = SessionStore(logins.path)
+    assert worker.email(session) == 'ann@example.com'
+    logins.drop(session)
+    assert worker.email(session) is None
+    # other sessions of the same user stay signed in
+    assert worker.email(other) == 'ann@example.com'
+    assert logins.email(None) is None and logins.email('') is None
+
+
+def test_unreadable_store_counts_as_logged_out(tmp_path):
+    path = tmp_path / 'sessions.sqlite3'
+    path.write_bytes(b'not a database' * 100)
+    assert SessionStore(str(path)).email('anything') is None
+
+
+@pytest.mark.parametrize('secret', ['', 'mentaltrack_secret_key', 'a_long_random_string_for_cookies'])
+def test_require_secret_refuses_missing_and_public_secrets(monkeypatch, secret):
+    monkeypatch.setattr(auth, 'STORAGE_SECRET', secret)
+    with pytest.raises(SystemExit):
+        auth.require_secret()
+
+
+def test_require_secret_accepts_a_private_secret(monkeypatch):
+    monkeypatch.setattr(auth, 'STORAGE_SECRET', 'k3yb0ard-cat-' * 3)
+    auth.require_secret()
@@ -0,0 +1,57 @@
+import pytest
+
+from columnar import JournalColumns
+
+
+def test_column_rejects_unknown_fields():
+    cols = JournalColumns()
+    cols.append({'uid': 'u1', 'push_id': '-a', 'username': 'ann', 'email': 'ann@example.com', 'mood': 3, 'summary': '', 'date': '2025-01-01', 'image': ''})
+    assert cols.column('mood') == [3.0]
+    for field in ('day', 'people', 'raw_mood', '__dict__'):
+        with pytest.raises(ValueError):
+            cols.column(field)
+
+
+def entry(push_id, mood, uid='u1'):
+    return {'uid': uid, 'push_id': push_id, 'username': 'ann', 'email': 'ann@example.com', 'mood': mood, 'summary': f'about {push_id}',
+            'date': '2025-01-01', 'image': ''}
+
+
+def test_numeric_strings_read_back_as_numbers():
+    cols = JournalColumns()
+    for push_id, mood in (('-int', '5'), ('-float', ' 4.5 '), ('-number', 3), ('-half', 2.5)):
+        cols.append(entry(push_id, mood))
+    assert [cols.row(i)['mood'] for i in range(4)] == [5, 4.5, 3, 2.5]
+    assert cols.column('mood') == [5.0, 4.5, 3.0, 2.5]
+    assert cols.mood_counts() == {5.0: 1, 4.5: 1, 3.0: 1, 2.5: 1}
+
+
+def test_non_numeric_moods_are_kept_as_given():
+    cols = JournalColumns()
+    for push_id, mood in (('-word', 'great'), ('-none', None), ('-empty', ''), ('-bool', True)):
+        cols.append(entry(push_id, mood))
+    assert [cols.row(i)['mood'] for i in range(4)] == ['great', None, None, True]
+    assert cols.column('mood') == ['great', None, None, True]
+    assert not cols.mood_counts()
+    # a later numeric value replaces the kept one, and the other way round
+    cols.update(0, entry('-word', 4))
+    cols.update(1, entry('-none', 'meh'))
+    assert [cols.row(i)['mood'] for i in range(2)] == [4, 'meh']
+    assert cols.raw_mood == {1: 'meh', 3: True}
+
+
+def test_remove_moves_the_last_entry_with_its_raw_mood():
+    cols = JournalColumns()
+    for push_id, mood in (('-a', 'great'), ('-b', 2), ('-c', 'awful'), ('-d', 'fine')):
+        cols.append(entry(push_id, mood, uid='u1' if push_id != '-d' else 'u2'))
+    # removing a slot moves the last entry into it, raw mood included
+    assert cols.remove(1) == ('u2', '-d')
+    assert [cols.row(i)['push_id'] for i in range(len(cols))] == ['-a', '-d', '-c']
+    assert cols.row(1)['mood'] == 'fine' and cols.row(1)['uid'] == 'u2'
+    assert cols.raw_mood == {0: 'great', 1: 'fine', 2: 'awful'}
+    # a removed raw mood does not linger on the slot it leaves
+    assert cols.remove(0) == ('u1', '-c')
+    assert cols.raw_mood == {0: 'awful', 1: 'fine'}
+    # the last slot has nothing to move
+    assert cols.remove(1) is None
+    assert cols.raw_mood == {0: 'awful'} and len(cols) == 1
@@ -0,0 +1,65 @@
+import csv
+import gzip
+import io
+import json
+
+import pytest
+
+from export import export_chunks, has_parquet
+
+COLUMNS = [{'label': 'Date', 'field': 'date'}, {'label': 'Mood', 'field': 'mood'}, {'label': 'Summary', 'field': 'summary'}]
+FIELDS = ('date', 'mood', 'summary')
+ROWS = [
+    {'date': '2025-01-02', 'mood': 4, 'summary': 'comma, "quoted"\nand a newline'},
+    {'date': '2025-01-01', 'mood': 'great', 'summary': 'ünïcode'},
+    {'date': '', 'mood': None, 'summary': ''},
+]
+
+
+def body(fmt, rows=ROWS, gzip_=False):
+    return b''.join(export_chunks(iter(rows), fmt, COLUMNS, FIELDS, {'mood': 'float64'}, gzip_))
+
+
+def test_csv_round_trips_through_a_reader():
+    got = list(csv.reader(io.StringIO(body('csv').decode('utf-8'))))
+    assert got[0] == ['Date', 'Mood', 'Summary']
+    assert got[1:] == [['2025-01-02', '4', 'comma, "quoted"\nand a newline'], ['2025-01-01', 'great', 'ünïcode'], ['', '', '']]
+
+
+def test_jsonl_is_one_object_per_row_and_gzip_wraps_it():
+    lines = body('jsonl').decode('utf-8').splitlines()
+    assert [json.loads(line) for line in lines] == ROWS
+    assert gzip.decompress(body('jsonl', gzip_=True)) == body('jsonl')
+
+
+def test_csv_spans_several_batches():
+    rows = [{'date': f'2025-01-{i % 28 + 1:02d}', 'mood': i % 5, 'summary': f'entry {i}'} for i in range(2500)]
+    chunks = list(export_chunks(iter(rows), 'csv', COLUMNS, FIELDS))
+    assert len(chunks) >= 3
+    assert len(list(csv.reader(io.StringIO(b''.join(chunks).decode('utf-8'))))) == len(rows) + 1
+
+
+@pytest.mark.skipif(not has_parquet(), reason='pyarrow is not installed')
+def test_parquet_types_the_mood_column():
+    import pyarrow.parquet as pq
+    table = pq.read_table(io.BytesIO(body('parquet')))
+    assert str(table.schema.field('mood').type) == 'double'
+    # a mood that is not a number is left empty rather than failing the column
+    assert table.column('mood').to_pylist() == [4.0, None, None]
+    assert table.column('summary').to_pylist() == [r['summary'] for r in ROWS]
+
+
+def test_unknown_format_is_rejected():
+    with pytest.raises(ValueError):
+        export_chunks(iter(ROWS), 'xml', COLUMNS, FIELDS)
+
+
+def test_endpoint_rejects_sorts_the_table_does_not_offer(app_main):
+    from fastapi.testclient import TestClient
+
+    client = TestClient(app_main.app)
+    for url in ('/export/journals?sort=date&desc=1', '/export/journals?sort=mood', '/export/users?sort=journals', '/export/users'):
+        assert client.get(url).status_code == 200, url
+    # summary is not sortable, mood is not a users column, and anything else is not a column at all
+    for url in ('/export/journals?sort=summary', '/export/users?sort=mood', '/export/journals?sort=__class__'):
+        assert client.get(url).status_code == 400, url
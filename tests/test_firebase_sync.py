@@ -0,0 +1,88 @@
+import copy
+
+import pytest
+
+from conftest import eventually, new_store, store_rows
+from firebase import FirebaseSync, transform_journals, transform_users
+
+
+def expected_rows(data):
+    # what a fresh transform of the whole tree gives
+    users = sorted(transform_users(data), key=lambda r: r['uid'])
+    journals = sorted(transform_journals(data), key=lambda r: (r['uid'], r['push_id']))
+    return users, journals
+
+
+def settle(sync, fake):
+    # flushes until the store matches the fake's tree; streamed events arrive asynchronously
+    expected = lambda: expected_rows(copy.deepcopy(fake.data))
+    eventually(lambda: sync.sync(timeout=5) and store_rows(sync.store) == expected())
+
+
+@pytest.fixture
+def sync(fake):
+    s = FirebaseSync(new_store(), base_url=fake.url, retry=0.1)
+    assert s.sync()
+    yield s
+    s.stop()
+
+
+def test_first_load_matches_transform(sync, fake):
+    assert store_rows(sync.store) == expected_rows(fake.data)
+    assert len(sync.store['journals']) == sum(len(u['journal']) for u in fake.data.values())
+
+
+def test_put_adds_and_replaces_entries(sync, fake):
+    uid = sorted(fake.data)[0]
+    push_id = next(iter(fake.data[uid]['journal']))
+    fake.push('put', f'/{uid}/journal/-added', {'Mood': 4, 'Summary': 'added entry', 'Date': '2025-02-03T10:00:00Z'})
+    fake.push('put', f'/{uid}/journal/{push_id}', {'Mood': 1, 'Summary': 'rewritten', 'Date': '`2025-02-04`'})
+    fake.push('put', '/new-user', {'profile': {'Username': 'newbie', 'Email': 'new@example.com'},
+                                   'journal': {'-first': {'Mood': 3, 'Summary': 'hello', 'Date': '2025-02-05'}}})
+    settle(sync, fake)
+    assert sync.journal('-added')['summary'] == 'added entry'
+    assert sync.journal(push_id)['date'] == '2025-02-04'
+    assert sync.store['users'][sync.user_pos['new-user']]['journals'] == 1
+
+
+def test_patch_merges_children(sync, fake):
+    first, second = sorted(fake.data)[:2]
+    fake.push('patch', f'/{first}/profile', {'Username': 'renamed'})
+    # multi-path update at the root, as a client's update() of several locations sends
+    fake.push('patch', '/', {f'{second}/profile/Email': 'moved@example.com', f'{second}/journal/-patched': {'Mood': 5, 'Summary': 'patched', 'Date': '2025-03-01'}})
+    settle(sync, fake)
+    assert sync.store['users'][sync.user_pos[first]]['username'] == 'renamed'
+    # the user's journal rows carry the new name too
+    assert {r['username'] for r in sync.recent_journals(first)} == {'renamed'}
+    assert sync.journal('-patched')['email'] == 'moved@example.com'
+
+
+def test_null_deletes(sync, fake):
+    uids = sorted(fake.data)
+    entry_owner, gone, emptied = uids[0], uids[1], uids[2]
+    push_id = next(iter(fake.data[entry_owner]['journal']))
+    gone_entries = list(fake.data[gone]['journal'])
+    fake.push('put', f'/{entry_owner}/journal/{push_id}', None)
+    fake.push('put', f'/{gone}', None)
+    fake.push('patch', f'/{emptied}', {'journal': None})
+    settle(sync, fake)
+    assert sync.journal(push_id) is None
+    assert gone not in sync.user_pos
+    assert all(sync.journal(p) is None for p in gone_entries)
+    assert sync.user_journals.count(emptied) == 0
+    assert sync.store['users'][sync.user_pos[emptied]]['journals'] == 0
+
+
+def test_reconnect_picks_up_changes_made_while_disconnected(sync, fake):
+    connections = fake.connections
+    uid = sorted(fake.data)[0]
+    removed = sorted(fake.data)[1]
+    with fake.lock:
+        # edited in place rather than pushed, so no stream hears about it
+        fake.data[uid]['profile']['Username'] = 'offline edit'
+        del fake.data[removed]
+    fake.drop_streams()
+    eventually(lambda: fake.connections > connections)
+    settle(sync, fake)
+    assert sync.store['users'][sync.user_pos[uid]]['username'] == 'offline edit'
+    assert removed not in sync.user_pos
@@ -0,0 +1,175 @@
+import io
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from PIL import Image
+
+import images
+from images import ImageCache
+
+
+def png(width, height, color=(200, 80, 40)):
+    out = io.BytesIO()
+    Image.new('RGB', (width, height), color).save(out, 'PNG')
+    return out.getvalue()
+
+
+class ImageServer:
+    # serves one PNG per path with an ETag; /redirect/<path> redirects to /<path>, and
+    # `fail` turns every answer into a 500
+
+    def __init__(self):
+        self.body = png(400, 200)
+        self.fail = False
+        self.hits = []
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.server.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                etag = f'"{self.path}"'
+                if self.path.startswith('/redirect/'):
+                    server.hits.append((self.path, 302))
+                    self.send_response(302)
+                    self.send_header('Location', '/' + self.path[len('/redirect/'):])
+                    self.end_headers()
+                    return
+                if server.fail:
+                    server.hits.append((self.path, 500))
+                    self.send_error(500)
+                    return
+                if self.headers.get('If-None-Match') == etag:
+                    server.hits.append((self.path, 304))
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.end_headers()
+                    return
+                server.hits.append((self.path, 200))
+                self.send_response(200)
+                self.send_header('Content-Type', 'image/png')
+                self.send_header('Content-Length', str(len(server.body)))
+                self.send_header('ETag', etag)
+                self.end_headers()
+                self.wfile.write(server.body)
+
+        return Handler
+
+
+@pytest.fixture
+def upstream():
+    server = ImageServer()
+    yield server
+    server.close()
+
+
+def test_resizes_to_jpeg_within_bounds(upstream, tmp_path):
+    cache = ImageCache(str(tmp_path), allow_private=True)
+    data, etag = cache.get(f'{upstream.url}/a.png', 64)
+    with Image.open(io.BytesIO(data)) as img:
+        assert img.format == 'JPEG'
+        assert img.size == (64, 32)
+    # a second request is served from the cache without touching the source
+    assert cache.get(f'{upstream.url}/a.png', 64) == (data, etag)
+    assert upstream.hits == [('/a.png', 200)]
+
+
+def test_revalidates_with_if_none_match(upstream, tmp_path):
+    cache = ImageCache(str(tmp_path), max_age=0, allow_private=True)
+    first = cache.get(f'{upstream.url}/a.png', 128)
+    second = cache.get(f'{upstream.url}/a.png', 128)
+    assert second == first
+    assert upstream.hits == [('/a.png', 200), ('/a.png', 304)]
+
+
+def test_serves_stale_thumbnail_when_source_fails(upstream, tmp_path):
+    cache = ImageCache(str(tmp_path), max_age=0, allow_private=True)
+    first = cache.get(f'{upstream.url}/a.png', 128)
+    upstream.fail = True
+    assert cache.get(f'{upstream.url}/a.png', 128) == first
+    # a fresh cache has nothing to fall back on
+    assert ImageCache(str(tmp_path / 'empty'), max_age=0, allow_private=True).get(f'{upstream.url}/b.png', 128) is None
+
+
+def test_refuses_private_addresses(upstream, tmp_path):
+    cache = ImageCache(str(tmp_path))
+    assert cache.get(f'{upstream.url}/a.png', 64) is None
+    assert upstream.hits == []
+    for url in ('http://127.0.0.1/a.png', 'http://localhost/a.png', 'http://10.1.2.3/a.png', 'http://192.168.0.1/a.png',
+                'http://169.254.169.254/latest/meta-data/', 'http://[::1]/a.png', 'http://[::ffff:127.0.0.1]/a.png',
+                'http://0.0.0.0/a.png', 'file:///etc/passwd', 'ftp://93.184.215.14/a.png', 'not a url'):
+        assert not images.public_address(url), url
+    assert images.public_address('https://93.184.215.14/a.png')
+    assert images.public_address('http://[2606:2800:21f:cb07:6820:80da:af6b:8b2c]/a.png')
+
+
+def test_checks_every_redirect_hop(upstream, tmp_path, monkeypatch):
+    cache = ImageCache(str(tmp_path), allow_private=True)
+    assert cache.get(f'{upstream.url}/redirect/a.png', 64) is not None
+    assert upstream.hits == [('/redirect/a.png', 302), ('/a.png', 200)]
+    # a first hop that passes the check cannot bounce the fetch to one that does not
+    upstream.hits.clear()
+    monkeypatch.setattr(images, 'public_address', lambda url: '/redirect/' in url)
+    assert ImageCache(str(tmp_path / 'strict')).get(f'{upstream.url}/redirect/b.png', 64) is None
+    assert upstream.hits == [('/redirect/b.png', 302)]
+
+
+def test_disk_lru_evicts_oldest_by_bytes(upstream, tmp_path):
+    probe = ImageCache(str(tmp_path / 'probe'), allow_private=True)
+    size = len(probe.get(f'{upstream.url}/probe.png', 128)[0])
+    cache = ImageCache(str(tmp_path / 'cache'), max_bytes=size * 3, memory_bytes=0, allow_private=True)
+    urls = [f'{upstream.url}/{i}.png' for i in range(5)]
+    for url in urls:
+        cache.get(url, 128)
+    assert cache.disk_size <= cache.max_bytes
+    kept = {name[:-4] for name in os.listdir(cache.path) if name.endswith('.jpg')}
+    assert cache.key(urls[-1], 128) in kept
+    assert cache.key(urls[0], 128) not in kept
+    assert len(kept) < len(urls)
+    # the index rebuilt from disk agrees with what is left
+    reopened = ImageCache(cache.path)
+    reopened._scan()
+    assert set(reopened.disk) == kept
+
+
+def test_endpoint_resolves_keys_from_the_store(upstream, tmp_path, monkeypatch, app_main):
+    from fastapi.testclient import TestClient
+
+    main = app_main
+    monkeypatch.setattr(main, 'images', ImageCache(str(tmp_path / 'images'), allow_private=True))
+    user = {'uid': 'u1', 'username': 'ann', 'email': 'ann@example.com', 'photo': f'{upstream.url}/avatar.png', 'journals': 2}
+    with main.sync.lock:
+        main.sync._apply_rows('u1', user, {
+            '-with-image': {'uid': 'u1', 'push_id': '-with-image', 'username': 'ann', 'email': 'ann@example.com',
+                            'mood': 3, 'summary': '', 'date': '2025-01-01', 'image': f'{upstream.url}/entry.png'},
+            '-no-image': {'uid': 'u1', 'push_id': '-no-image', 'username': 'ann', 'email': 'ann@example.com',
+                          'mood': 3, 'summary': '', 'date': '2025-01-01', 'image': ''},
+        })
+    client = TestClient(main.app)
+    try:
+        r = client.get('/images/journal/-with-image?size=64')
+        assert r.status_code == 200
+        assert r.headers['content-type'] == 'image/jpeg'
+        assert client.get('/images/journal/-with-image?size=64', headers={'If-None-Match': r.headers['etag']}).status_code == 304
+        assert client.get('/images/user/u1?size=128').status_code == 200
+        assert client.get('/images/journal/-unknown?size=64').status_code == 404
+        assert client.get('/images/journal/-no-image?size=64').status_code == 404
+        assert client.get('/images/user/nobody?size=64').status_code == 404
+        assert client.get('/images/other/u1?size=64').status_code == 404
+        assert client.get('/images/journal/-with-image?size=65').status_code == 400
+    finally:
+        with main.sync.lock:
+            main.sync._remove_user('u1')
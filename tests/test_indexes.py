@@ -0,0 +1,159 @@
+import random
+
+from indexes import SMALL, DateIndex, TextIndex, members
+
+WORDS = ['coffee', 'coffeehouse', 'cafe', 'tea', 'walk', 'calm', 'ab', 'x', 'stress']
+
+
+def tokens_match(index, row, terms):
+    tokens = index.tokens(row)
+    return all(any(term in token for token in tokens) for term in terms)
+
+
+def brute(index, rows, query):
+    terms = query.lower().split()
+    return {key for key, row in rows.items() if tokens_match(index, row, terms)}
+
+
+def test_load_is_indexed_on_first_search():
+    index = TextIndex(('summary',))
+    index.load([(1, {'summary': 'Morning coffee'}), (2, {'summary': 'evening tea'})])
+    assert index.pending is not None and not index.postings
+    assert index.search('COFFEE') == {1}
+    assert index.pending is None
+    assert index.search('') is None and index.search('   ') is None
+
+
+def test_terms_match_substrings_of_tokens_and_whole_fields():
+    index = TextIndex(('username', 'email'), whole_fields=('email',))
+    index.load([('a', {'username': 'Ann Lee', 'email': 'ann@example.com'}), ('b', {'username': 'bob', 'email': 'bob@example.org'})])
+    assert index.search('ann') == {'a'}
+    assert index.search('example') == {'a', 'b'}
+    # short terms scan the vocabulary instead of the trigrams
+    assert index.search('ob') == {'b'}
+    # every term has to match, each in any field
+    assert index.search('lee example.com') == {'a'}
+    assert index.search('lee bob') == set()
+    assert index.search('nomatch') == set()
+
+
+def test_update_and_remove_unlink_the_old_tokens():
+    index = TextIndex(('summary',))
+    rows = {1: {'summary': 'coffee walk'}, 2: {'summary': 'coffee'}}
+    index.load(list(rows.items()))
+    index.add(1, {'summary': 'tea walk'}, rows[1])
+    assert index.search('coffee') == {2}
+    assert index.search('tea') == {1}
+    index.remove(2, rows[2])
+    assert index.search('coffee') == set()
+    # a token nobody has any more is gone from the vocabulary and its trigrams
+    assert 'coffee' not in index.postings
+    assert not any('coffee' in members(tokens) for tokens in index.trigrams.values())
+
+
+def test_shared_tokens_grow_into_sets_and_shrink_back():
+    index = TextIndex(('summary',))
+    count = SMALL + 5
+    for key in range(count):
+        index.add(key, {'summary': 'coffee'})
+        assert index.search('coffee') == set(range(key + 1))
+    assert isinstance(index.postings['coffee'], set)
+    for key in range(count - 1):
+        index.remove(key, {'summary': 'coffee'})
+        assert index.search('offe') == set(range(key + 1, count))
+    # one holder left is kept bare, none removes the token
+    assert index.postings['coffee'] == count - 1
+    index.remove(count - 1, {'summary': 'coffee'})
+    assert 'coffee' not in index.postings and index.search('coffee') == set()
+
+
+def test_interleaved_changes_agree_with_a_scan():
+    rnd = random.Random(7)
+    index = TextIndex(('summary', 'name'), whole_fields=('name',))
+
+    def row():
+        return {'summary': ' '.join(rnd.sample(WORDS, rnd.randint(0, 3))), 'name': rnd.choice(['Ann Lee', 'bob', '', None])}
+    rows = {(i, 'p'): row() for i in range(40)}
+    index.load(list(rows.items()))
+    queries = WORDS + ['offe', 'ee', 'e', 'ann lee', 'lee cafe', 'zz', 'coffee walk']
+    for step in range(2000):
+        key = (rnd.randint(0, 60), 'p')
+        if rnd.random() < 0.3:
+            if key in rows:
+                index.remove(key, rows.pop(key))
+        else:
+            new = row()
+            index.add(key, new, rows.get(key))
+            rows[key] = new
+        query = rnd.choice(queries)
+        assert index.search(query) == brute(index, rows, query), (step, query)
+
+
+def dated(days, start=None, end=None, keys=None):
+    start = -1 if start is None else start
+    end = 10 ** 9 if end is None else end
+    found = {k for k, day in days.items() if day is not None and start <= day <= end}
+    return found if keys is None else found & set(keys)
+
+
+def test_date_range_bounds_are_inclusive_and_undated_rows_never_match():
+    index = DateIndex()
+    index.load([('a', 10), ('b', 12), ('c', 12), ('d', None), ('e', 20)])
+    assert index.select(12, 12) == {'b', 'c'}
+    assert index.select(11, 19) == {'b', 'c'}
+    assert index.select(None, 12) == {'a', 'b', 'c'}
+    assert index.select(13) == {'e'}
+    assert index.select() == {'a', 'b', 'c', 'e'}
+    assert index.select(21) == set()
+
+
+def test_select_within_keys_takes_either_side():
+    index = DateIndex()
+    index.load((i, i % 30) for i in range(300))
+    # fewer keys than rows in range: each key's day is looked up
+    assert index.select(5, 25, [3, 35, 4, 295, 1000]) == {35, 295}
+    # more keys than rows in range: the range is intersected with them
+    assert index.select(5, 5, set(range(0, 300, 2))) == {i for i in range(0, 300, 2) if i % 30 == 5}
+    assert index.select(None, None, []) == set()
+
+
+def test_few_changes_are_inserted_in_place():
+    index = DateIndex()
+    index.load((i, i % 50) for i in range(400))
+    index.settle()
+    ordinals, keys = index.ordinals, index.keys
+    index.add(0, 7)
+    index.add(400, 0)
+    index.add(401, 49)
+    index.remove(3)
+    index.add(5, None)
+    assert index.select(0, 0) == {50 * i for i in range(1, 8)} | {400}
+    # the same arrays were edited rather than rebuilt by a re-sort
+    assert index.ordinals is ordinals and index.keys is keys
+    assert list(index.ordinals) == sorted(index.ordinals)
+    assert index.select(7, 7) == {i for i in range(400) if i % 50 == 7} | {0}
+    assert 3 not in index.select() and 5 not in index.select()
+
+
+def test_date_changes_agree_with_a_scan():
+    rnd = random.Random(11)
+    index = DateIndex()
+    days = {i: rnd.randint(0, 60) for i in range(500)}
+    index.load(days.items())
+    for step in range(3000):
+        key = rnd.randint(0, 600)
+        if rnd.random() < 0.3:
+            index.remove(key)
+            days.pop(key, None)
+        else:
+            day = rnd.choice([rnd.randint(0, 60), None])
+            index.add(key, day)
+            days[key] = day
+        # mostly a query after each change (inserted in place), sometimes after a burst (re-sorted)
+        if rnd.random() < (0.02 if step % 500 < 100 else 0.7):
+            continue
+        start, end = sorted(rnd.choice([None, rnd.randint(-5, 65)]) or 0 for _ in range(2))
+        keys = rnd.sample(range(700), rnd.choice([3, 300])) if rnd.random() < 0.5 else None
+        assert index.select(start, end, keys) == dated(days, start, end, keys), step
+        assert list(index.ordinals) == sorted(index.ordinals)
+        assert len(index.keys) == len(index.days) == len([d for d in days.values() if d is not None])
@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+
+import scheduler
+from scheduler import RefreshScheduler
+
+
+class Stop(Exception):
+    pass
+
+
+def run(outcomes, monkeypatch, **kwargs):
+    # runs the scheduler over `outcomes` (True, False or an exception per refresh) and returns the delays it slept
+    outcomes = list(outcomes)
+    delays = []
+
+    async def refresh():
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    async def sleep(delay):
+        delays.append(delay)
+        if not outcomes:
+            raise Stop()
+    monkeypatch.setattr(scheduler.asyncio, 'sleep', sleep)
+    with pytest.raises(Stop):
+        asyncio.run(RefreshScheduler(refresh, **kwargs).run())
+    return delays
+
+
+def test_backs_off_exponentially_up_to_the_cap_and_resets_on_success(monkeypatch):
+    delays = run([True, False, False, RuntimeError('down'), False, False, True, True], monkeypatch, interval=10, jitter=0, max_backoff=100)
+    # an exception counts as a failure like a False
+    assert delays == [10, 20, 40, 80, 100, 100, 10, 10]
+
+
+def test_cap_below_the_interval_keeps_the_interval(monkeypatch):
+    assert run([False, False], monkeypatch, interval=30, jitter=0, max_backoff=5) == [30, 30]
+
+
+def test_jitter_spreads_delays_within_the_fraction():
+    s = RefreshScheduler(None, interval=10, jitter=0.2, max_backoff=600)
+    delays = [s.next_delay() for _ in range(500)]
+    assert all(8 <= d <= 12 for d in delays)
+    # spread out rather than all on one value
+    assert max(delays) - min(delays) > 2
+    s.failures = 3
+    assert all(64 <= s.next_delay() <= 96 for _ in range(100))
+    # a jitter of 1 or more never sleeps a negative time
+    s = RefreshScheduler(None, interval=10, jitter=3, max_backoff=600)
+    assert all(s.next_delay() >= 0 for _ in range(100))
+
+
+def test_interval_zero_refreshes_once(monkeypatch):
+    calls = []
+
+    async def refresh():
+        calls.append(1)
+        return False
+    monkeypatch.setattr(scheduler.asyncio, 'sleep', lambda delay: pytest.fail('slept'))
+    asyncio.run(RefreshScheduler(refresh, interval=0, jitter=0, max_backoff=0).run())
+    assert calls == [1]
+
+
+def test_settings_come_from_the_environment(monkeypatch):
+    monkeypatch.setenv('REFRESH_INTERVAL', '5')
+    monkeypatch.setenv('REFRESH_JITTER', '0')
+    monkeypatch.setenv('REFRESH_MAX_BACKOFF', '12')
+    s = RefreshScheduler(None)
+    assert (s.interval, s.jitter, s.max_backoff) == (5.0, 0.0, 12.0)
+    s.failures = 10
+    assert s.next_delay() == 12
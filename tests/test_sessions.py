@@ -0,0 +1,85 @@
+import pytest
+
+from conftest import eventually, new_store
+from firebase import FirebaseSync
+from sessions import Sessions
+
+
+@pytest.fixture
+def sync(fake):
+    s = FirebaseSync(new_store(), base_url=fake.url, retry=0.1)
+    assert s.sync()
+    yield s
+    s.stop()
+
+
+def edit(sync, fake, path, value):
+    # pushes one change and flushes until it has landed as a new version
+    version = sync.version
+    fake.push('put', path, value)
+    eventually(lambda: sync.sync(timeout=5) and sync.version > version)
+
+
+def test_publish_hands_each_page_what_changed_since_it_rendered(sync, fake):
+    sessions = Sessions(sync)
+    seen = {'current': [], 'behind': [], 'gone': []}
+    sessions.subscribe('current', seen['current'].append, sync.version)
+    # rendered before the first load, which the change log does not reach back to
+    sessions.subscribe('behind', seen['behind'].append, 0)
+    sessions.subscribe('gone', seen['gone'].append, 0, alive=lambda: False)
+    sessions.publish()
+    assert seen == {'current': [], 'behind': [None], 'gone': []}
+    # a closed page is dropped rather than updated
+    assert len(sessions) == 2
+
+    uid = sorted(fake.data)[0]
+    push_id = next(iter(fake.data[uid]['journal']))
+    edit(sync, fake, f'/{uid}/journal/{push_id}/Summary', 'edited')
+    sessions.publish()
+    assert seen['current'] == [({uid}, {(uid, push_id)})]
+    assert seen['behind'] == [None, ({uid}, {(uid, push_id)})]
+    # nothing new: nobody is called again
+    sessions.publish()
+    assert len(seen['current']) == 1 and len(seen['behind']) == 2
+
+
+def test_changes_accumulate_for_a_page_that_skipped_versions(sync, fake):
+    sessions = Sessions(sync)
+    seen = []
+    sessions.subscribe('page', seen.append, sync.version)
+    first, second = sorted(fake.data)[:2]
+    edit(sync, fake, f'/{first}/profile/Username', 'renamed')
+    edit(sync, fake, f'/{second}', None)
+    sessions.publish()
+    users, journals = seen[0]
+    assert users == {first, second}
+    # a renamed user's entries all show the new name, and a removed user's entries are gone
+    assert {(first, p) for p in fake.data[first]['journal']} <= journals
+    assert any(uid == second for uid, _ in journals)
+
+
+def test_a_failing_page_does_not_stop_the_others(sync, fake):
+    sessions = Sessions(sync)
+    seen = []
+
+    def broken(changes):
+        raise RuntimeError('page went away mid-update')
+    sessions.subscribe('broken', broken, sync.version, alive=lambda: True)
+    sessions.subscribe('fine', seen.append, sync.version)
+    uid = sorted(fake.data)[0]
+    edit(sync, fake, f'/{uid}/profile/Email', 'new@example.com')
+    sessions.publish()
+    assert seen == [({uid}, {(uid, p) for p in fake.data[uid]['journal']})]
+    # a page that is still connected stays subscribed, at the new version
+    assert sessions.pages['broken'][1] == sync.version
+
+
+def test_changes_since_bounds(sync, fake):
+    assert sync.changes_since(sync.version) == (set(), set())
+    assert sync.changes_since(None) is None
+    version = sync.version
+    uid = sorted(fake.data)[0]
+    edit(sync, fake, f'/{uid}/profile/Username', 'first')
+    assert sync.changes_since(version)[0] == {uid}
+    # a version older than the log's first entry asks for a full refresh
+    assert sync.changes_since(version - 1) is None
@@ -0,0 +1,65 @@
+import time
+
+from conftest import eventually, new_store, store_rows
+from firebase import FirebaseSync
+from snapshot_cache import SnapshotCache
+
+
+def test_acquire_is_exclusive_and_renewable(tmp_path):
+    cache = SnapshotCache(str(tmp_path / 'snapshot.sqlite3'))
+    assert cache.acquire('a', 60)
+    assert not cache.acquire('b', 60)
+    assert cache.acquire('a', 60)
+    assert not cache.acquire('b', 60)
+
+
+def test_takeover_after_expiry(tmp_path):
+    cache = SnapshotCache(str(tmp_path / 'snapshot.sqlite3'))
+    assert cache.acquire('a', 0.1)
+    time.sleep(0.2)
+    assert cache.acquire('b', 60)
+    # the old leader cannot take it back, nor release what it no longer holds
+    assert not cache.acquire('a', 60)
+    cache.release('a')
+    assert not cache.acquire('a', 60)
+    cache.release('b')
+    assert cache.acquire('a', 60)
+
+
+def test_follower_reads_leader_snapshot(fake, tmp_path):
+    path = str(tmp_path / 'snapshot.sqlite3')
+    leader = FirebaseSync(new_store(), base_url=fake.url, cache=SnapshotCache(path), retry=0.1)
+    follower = FirebaseSync(new_store(), base_url=fake.url, cache=SnapshotCache(path))
+    try:
+        assert leader.sync()
+        assert follower.follow() is not None
+        assert store_rows(follower.store) == store_rows(leader.store)
+        cursor = follower.cursor
+
+        uids = sorted(fake.data)
+        changed, removed = uids[0], uids[1]
+        push_id = next(iter(fake.data[changed]['journal']))
+        removed_journals = {(removed, p) for p in fake.data[removed]['journal']}
+        fake.push('patch', f'/{changed}/journal', {push_id: None, '-new': {'Mood': 2, 'Summary': 'new entry', 'Date': '2025-01-02'}})
+        fake.push('put', f'/{removed}', None)
+
+        def leader_caught_up():
+            leader.sync()
+            return removed not in leader.user_pos and (changed, '-new') in leader.journal_pos
+        eventually(leader_caught_up)
+
+        # only the two touched users are read back
+        delta = follower.cache.load_since(cursor)
+        assert not delta['full']
+        assert {r['uid'] for r in delta['users']} == {changed}
+        assert delta['removed'] == [removed]
+
+        version = follower.version
+        assert follower.follow() is not None
+        assert follower.version == version + 1
+        assert store_rows(follower.store) == store_rows(leader.store)
+        users, journals = follower.changes_since(version)
+        assert users == {changed, removed}
+        assert {(changed, push_id), (changed, '-new')} | removed_journals <= journals
+    finally:
+        leader.stop()
@@ -0,0 +1,82 @@
+import random
+
+import pytest
+
+from columnar import JournalColumns
+from tables import TableQuery, is_empty, sort_key
+
+MOODS = [3, None, 1, '', 5, 3, float('nan'), 'great', 2, None, 3, 'awful', 4, '', 1]
+
+
+def journal(i, mood):
+    return {'uid': f'u{i % 4}', 'push_id': f'-{i:03d}', 'username': f'user{i % 4}', 'email': f'user{i % 4}@example.com',
+            'mood': mood, 'summary': '', 'date': f'2025-01-{i % 28 + 1:02d}', 'image': ''}
+
+
+def expected(values, matches, descending):
+    # filled values by sort_key with ties in position order, reversed as a whole descending; empties last by position
+    positions = sorted(range(len(values)) if matches is None else matches)
+    filled = sorted((i for i in positions if not is_empty(values[i])), key=lambda i: sort_key(values[i]))
+    if descending:
+        filled.reverse()
+    return filled + [i for i in positions if is_empty(values[i])]
+
+
+@pytest.fixture(params=['dicts', 'columns'])
+def rows(request):
+    # the same moods repeated, so ties and empties are spread over the whole table
+    moods = MOODS * 8
+    if request.param == 'dicts':
+        return [{'uid': f'u{i}', 'mood': m} for i, m in enumerate(moods)]
+    cols = JournalColumns()
+    for i, m in enumerate(moods):
+        cols.append(journal(i, m))
+    return cols
+
+
+@pytest.mark.parametrize('descending', [False, True])
+def test_select_keeps_empties_last_on_both_paths(rows, descending):
+    query = TableQuery(lambda: rows, lambda: 1)
+    values = query.values(rows, 'mood')
+    rnd = random.Random(1)
+    narrow = rnd.sample(range(len(rows)), 10)
+    wide = rnd.sample(range(len(rows)), len(rows) // 2)
+    # None and the wide filter use the cached full order, the narrow one (under 1/8 of the rows) sorts directly
+    for matches in (None, wide, narrow, set(narrow)):
+        got = query.select(matches, 'mood', descending)
+        assert got == expected(values, matches, descending), matches
+        empties = [i for i in got if is_empty(values[i])]
+        assert got[len(got) - len(empties):] == empties
+
+
+@pytest.mark.parametrize('descending', [False, True])
+def test_pages_agree_across_paths(rows, descending):
+    query = TableQuery(lambda: rows, lambda: 1)
+    # a page of the full order, and the same rows reached through a narrow filter of that page's positions
+    positions = query.select(None, 'mood', descending)
+    page, total, number = query.page(None, 'mood', descending, 2, 5)
+    assert (total, number) == (len(rows), 2)
+    assert page == [rows[i] for i in positions[5:10]]
+    narrow, _, _ = query.page(positions[5:10], 'mood', descending, 1, 5)
+    assert narrow == page
+    # out-of-range pages clamp to the last one
+    last, _, number = query.page(None, 'mood', descending, 999, 25)
+    assert number == -(-len(rows) // 25) and last == [rows[i] for i in positions[(number - 1) * 25:]]
+    # no page size means everything on one page
+    assert query.page(None, 'mood', descending, 3, 0)[1:] == (len(rows), 1)
+
+
+def test_cached_order_follows_the_version(rows):
+    version = [1]
+    query = TableQuery(lambda: rows, lambda: version[0])
+    before = query.select(None, 'mood', False)
+    if isinstance(rows, list):
+        rows[before[0]]['mood'] = 99
+    else:
+        rows.update(before[0], journal(before[0], 99))
+    # same version: the cached order is reused as is
+    assert query.select(None, 'mood', False) == before
+    version[0] += 1
+    after = query.select(None, 'mood', False)
+    assert after != before
+    assert after == expected(query.values(rows, 'mood'), None, False)